@@ -1,18 +1,14 @@
 # import the necessary packages
 from __future__ import print_function
+import os
+import sys
 import numpy as np
 import argparse
 import cv2
- 
-def adjust_gamma(image, gamma=1.0):
-	# build a lookup table mapping the pixel values [0, 255] to
-	# their adjusted gamma values
-	invGamma = 1.0 / gamma
-	table = np.array([((i / 255.0) ** invGamma) * 255
-		for i in np.arange(0, 256)]).astype("uint8")
- 
-	# apply gamma correction using the lookup table
-	return cv2.LUT(image, table)
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from utils.gamma import adjustGamma, estimateGamma
 
 # construct the argument parse and parse the arguments
 ap = argparse.ArgumentParser()
@@ -23,16 +19,20 @@ args = vars(ap.parse_args())
 # load the original image
 original = cv2.imread(args["image"])
 
-# loop over various values of gamma
-for gamma in np.arange(0.0, 3.5, 0.5):
+# the gamma the detectors would pick for this image
+auto = estimateGamma(original)
+print("estimated gamma: {:.2f}".format(auto))
+
+# loop over various values of gamma, then the estimated one
+for gamma in list(np.arange(0.0, 3.5, 0.5)) + [auto]:
 	# ignore when gamma is 1 (there will be no change to the image)
 	if gamma == 1:
 		continue
  
 	# apply gamma correction and show the images
 	gamma = gamma if gamma > 0 else 0.1
-	adjusted = adjust_gamma(original, gamma=gamma)
-	cv2.putText(adjusted, "g={}".format(gamma), (10, 30),
+	adjusted = adjustGamma(original, gamma=gamma)
+	cv2.putText(adjusted, "g={:.2f}".format(gamma), (10, 30),
 		cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 3)
 	cv2.imshow("Images", np.hstack([original, adjusted]))
-	cv2.waitKey(0)
\ No newline at end of file
+	cv2.waitKey(0)
@@ -0,0 +1,91 @@
+# The optical flow engines in utils/flow_engine.py on a recorded clip: time per frame, and how
+# well each engine's per-person motion score (mean flow magnitude in the box, as the knife
+# detector scores people) agrees with Farneback over the whole frame.
+# People come from the person detector, or with --grid from an N x N grid of cells so the
+# benchmark also runs without the models. Run from the repository root.
+from __future__ import print_function
+import os
+import sys
+import timeit
+import argparse
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from utils.flow_engine import createFlowEngine, pixelRegions, ENGINES
+from utils.gamma import GammaCorrector
+from utils.replay_source import openSource, FAST
+
+SCALE = 0.3
+HUMAN_THRESH = 0.3
+REFERENCE = 'farneback'
+
+
+def loadFrames(source, count):
+    # Scaled and brightened as the knife detector sees them
+    cap = openSource(source, clock=FAST)
+    gamma = GammaCorrector()
+    frames = []
+    while len(frames) < count:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(gamma.correct(cv2.resize(frame, None, fx=SCALE, fy=SCALE)))
+    return frames
+
+
+def gridBoxes(cells):
+    step = 1.0/cells
+    return [(row*step, col*step, (row + 1)*step, (col + 1)*step) for row in range(cells) for col in range(cells)]
+
+
+def motionScores(flow, boxes):
+    mag, ang = cv2.cartToPolar(flow[..., 0], flow[..., 1])
+    height, width = mag.shape
+    scores = []
+    for ymin, xmin, ymax, xmax in boxes:
+        region = mag[int(ymin*height):max(int(ymax*height), int(ymin*height) + 1),
+                     int(xmin*width):max(int(xmax*width), int(xmin*width) + 1)]
+        scores.append(region.mean())
+    return scores
+
+
+def run(engine, grays, boxes):
+    # Time per frame and the per-person scores of every frame
+    scores = []
+    elapsed = 0
+    for prev, gray, frameBoxes in zip(grays, grays[1:], boxes[1:]):
+        start = timeit.default_timer()
+        flow = engine.compute(prev, gray, frameBoxes)
+        elapsed += timeit.default_timer() - start
+        scores.extend(motionScores(flow, frameBoxes))
+    return elapsed/max(len(grays) - 1, 1), np.array(scores)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('source', help='video file or directory of frames')
+    parser.add_argument('--frames', type=int, default=200)
+    parser.add_argument('--grid', type=int, default=0, help='score an N x N grid instead of detected people')
+    parser.add_argument('--engines', nargs='+', default=sorted(ENGINES), choices=sorted(ENGINES))
+    args = parser.parse_args()
+
+    frames = loadFrames(args.source, args.frames)
+    grays = [cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) for frame in frames]
+    if args.grid:
+        boxes = [gridBoxes(args.grid)]*len(frames)
+    else:
+        from objects.humanDetector import getSharedHumanDetector
+        detector = getSharedHumanDetector()
+        boxes = [detector.detect(frame, min_score_thresh=HUMAN_THRESH) for frame in frames]
+    print('%d frames, %d people' % (len(frames), sum(len(frameBoxes) for frameBoxes in boxes[1:])))
+
+    referenceTime, reference = run(createFlowEngine(REFERENCE), grays, boxes)
+    print('engine          ms/frame  speed-up  correlation  mean abs diff')
+    for name in args.engines:
+        elapsed, scores = run(createFlowEngine(name), grays, boxes)
+        correlation = np.corrcoef(reference, scores)[0, 1] if len(scores) > 1 and scores.std() > 0 else float('nan')
+        difference = np.abs(reference - scores).mean() if len(scores) else float('nan')
+        print('%-15s %8.2f %8.1fx %12.3f %14.3f' % (name, 1000*elapsed, referenceTime/elapsed, correlation, difference))
@@ -0,0 +1,144 @@
+# Compares moving camera frames from a capture loop to two detector consumers:
+#   threads - the current design, both consumers share one process and the GIL
+#   pickle  - worker processes fed through a multiprocessing.Queue (frames are pickled)
+#   shm     - worker processes fed through utils.shared_frames.FrameRing (zero copy)
+# The consumers do WORK_MS of pure Python work per frame to stand in for the
+# GIL-holding parts of a detector (drawing, box conversion, voting).
+from __future__ import print_function
+import os
+import sys
+import time
+import queue
+import argparse
+import threading
+import multiprocessing
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from utils.frame_hub import Frame
+from utils.shared_frames import FrameRing
+
+CONSUMERS = 2
+
+
+def busyWork(image, work_ms):
+    end = time.time() + work_ms/1000.0
+    total = 0
+    while time.time() < end:
+        total += 1
+    return int(image[0, 0, 0]) + total
+
+
+def pickleConsumer(frames, done, work_ms):
+    while True:
+        frame = frames.get()
+        if frame is None:
+            break
+        busyWork(frame.image, work_ms)
+        done.put(frame.seq)
+
+
+def shmConsumer(ring, index, done, stopEvent, work_ms):
+    reader = ring.reader(index)
+    while not stopEvent.is_set():
+        frame = reader.read(timeout=0.1)
+        if frame is None:
+            continue
+        busyWork(frame.image, work_ms)
+        done.put(frame.seq)
+    reader.close()
+
+
+def runThreads(image, seconds, work_ms):
+    processed = [0]*CONSUMERS
+    lock = threading.Lock()
+    latest = [None]
+    running = [True]
+
+    def consume(index):
+        last = -1
+        while running[0]:
+            frame = latest[0]
+            if frame is None or frame.seq == last:
+                time.sleep(0.0005)
+                continue
+            last = frame.seq
+            busyWork(frame.image, work_ms)
+            with lock:
+                processed[index] += 1
+
+    threads = [threading.Thread(target=consume, args=(i,)) for i in range(CONSUMERS)]
+    for thread in threads:
+        thread.start()
+    seq = 0
+    end = time.time() + seconds
+    while time.time() < end:
+        latest[0] = Frame(seq, time.time(), image.copy())
+        seq += 1
+    running[0] = False
+    for thread in threads:
+        thread.join()
+    return seq, sum(processed)
+
+
+def runPickle(context, image, seconds, work_ms):
+    queues = [context.Queue(maxsize=1) for _ in range(CONSUMERS)]
+    done = context.Queue()
+    workers = [context.Process(target=pickleConsumer, args=(q, done, work_ms)) for q in queues]
+    for worker in workers:
+        worker.start()
+    seq = 0
+    end = time.time() + seconds
+    while time.time() < end:
+        frame = Frame(seq, time.time(), image)
+        for q in queues:
+            try:
+                q.put_nowait(frame)
+            except queue.Full:
+                pass
+        seq += 1
+    for q in queues:
+        q.put(None)
+    for worker in workers:
+        worker.join()
+    return seq, done.qsize()
+
+
+def runShm(context, image, seconds, work_ms):
+    ring = FrameRing(context, image.shape, CONSUMERS)
+    done = context.Queue()
+    stopEvent = context.Event()
+    workers = [context.Process(target=shmConsumer, args=(ring, i, done, stopEvent, work_ms)) for i in range(CONSUMERS)]
+    for worker in workers:
+        worker.start()
+    seq = 0
+    end = time.time() + seconds
+    while time.time() < end:
+        ring.publish(Frame(seq, time.time(), image))
+        seq += 1
+    stopEvent.set()
+    for worker in workers:
+        worker.join()
+    ring.unlink()
+    return seq, done.qsize()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--work-ms', type=float, default=10)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('spawn')
+    image = np.random.randint(0, 255, (args.height, args.width, 3), dtype=np.uint8)
+
+    for name, run in (('threads', lambda: runThreads(image, args.seconds, args.work_ms)),
+                      ('pickle', lambda: runPickle(context, image, args.seconds, args.work_ms)),
+                      ('shm', lambda: runShm(context, image, args.seconds, args.work_ms))):
+        produced, consumed = run()
+        print('%-8s produced %8.1f fps, consumed %7.1f fps per consumer' % (name,
+            produced/args.seconds, consumed/float(CONSUMERS)/args.seconds))
@@ -0,0 +1,63 @@
+# Person + knife inference latency per frame: the two SSDs in separate sessions run one
+# after the other (OpticalflowDetector's default) vs both in one graph and one sess.run
+# (objects/fusedDetector.py). Run from the repository root.
+from __future__ import print_function
+import os
+import sys
+import timeit
+import argparse
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from objects.cnnDetector import CNNDetector
+from objects.humanDetector import HumanDetector
+from objects.fusedDetector import FusedDetector
+from utils.replay_source import openSource, FAST
+
+SCALE = 0.3
+
+
+def loadFrames(source, count):
+    frames = []
+    if source is None:
+        return [np.random.randint(0, 255, (144, 192, 3), dtype=np.uint8) for _ in range(count)]
+    cap = openSource(source, clock=FAST)
+    while len(frames) < count:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(cv2.resize(frame, None, fx=SCALE, fy=SCALE))
+    return frames
+
+
+def timeFrames(fn, frames):
+    fn(frames[0]) # warm up
+    times = []
+    for frame in frames:
+        start = timeit.default_timer()
+        fn(frame)
+        times.append(timeit.default_timer() - start)
+    return np.mean(times), np.median(times), np.percentile(times, 95)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--source', default=None, help='video file or directory of frames, random frames if omitted')
+    parser.add_argument('--frames', type=int, default=100)
+    args = parser.parse_args()
+
+    frames = loadFrames(args.source, args.frames)
+    hd = HumanDetector(0.3)
+    cnn = CNNDetector()
+    fused = FusedDetector()
+
+    def sequential(frame):
+        cnn.detect(frame)
+        hd.run(frame)
+
+    print('%-10s %9s %9s %9s' % ('', 'mean (s)', 'median', 'p95'))
+    for name, fn in (('sequential', sequential), ('fused', fused.run)):
+        print('%-10s %9.4f %9.4f %9.4f' % ((name,) + timeFrames(fn, frames)))
@@ -0,0 +1,105 @@
+# Keyframe scheduling (utils/box_tracker.py): how often the detector really runs for a few
+# keyframe intervals, with keyframes split into scheduled ones and ones forced early by a
+# shaky track or a motion spike, and how far the interpolated boxes drift from what the
+# detector finds on the same frames. OpenCV's HOG people detector stands in for the person
+# SSD so it runs without TensorFlow; boxes are moved by Farneback flow as in the knife
+# pipeline. Run from the repository root.
+from __future__ import print_function
+import os
+import sys
+import timeit
+import argparse
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from object_detection.utils import np_box_ops
+from utils.box_tracker import BoxTracker, KeyframeScheduler
+from utils.flow_engine import FarnebackFlow
+from utils.replay_source import openSource, FAST
+
+
+def loadFrames(source, count, scale):
+    cap = openSource(source, clock=FAST)
+    frames = []
+    while len(frames) < count:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if scale != 1.0:
+            frame = cv2.resize(frame, None, fx=scale, fy=scale)
+        frames.append(frame)
+    return frames
+
+
+def detectPeople(hog, frame):
+    # Normalised (ymin, xmin, ymax, xmax) boxes, as HumanDetector returns them
+    height, width = frame.shape[:2]
+    rects, _ = hog.detectMultiScale(frame, winStride=(8, 8))
+    return [(y/float(height), x/float(width), (y + h)/float(height), (x + w)/float(width)) for x, y, w, h in rects]
+
+
+def drift(tracked, detected):
+    # Mean IoU of every detection with the tracked box closest to it, 1 when both are empty
+    if len(detected) == 0:
+        return 1.0 if len(tracked) == 0 else 0.0
+    if len(tracked) == 0:
+        return 0.0
+    iou = np_box_ops.iou(np.array(detected, dtype=np.float64), np.array(tracked, dtype=np.float64))
+    return float(iou.max(axis=1).mean())
+
+
+def run(frames, flows, detections, interval, detect):
+    scheduler = KeyframeScheduler(interval)
+    tracker = BoxTracker()
+    overlaps = []
+    elapsed = 0.0
+    for i, frame in enumerate(frames):
+        start = timeit.default_timer()
+        motion = float(np.abs(flows[i - 1]).mean()) if i > 0 else None
+        keyframe = scheduler.isKeyframe(tracker.minConfidence() if i > 0 else 0.0, motion)
+        if keyframe:
+            tracker.reset(detect(frame))
+        else:
+            tracker.propagateFlow(flows[i - 1])
+        elapsed += timeit.default_timer() - start
+        if not keyframe:
+            overlaps.append(drift([track.box for track in tracker.tracks], detections[i]))
+    return elapsed/len(frames), scheduler.getStats(), overlaps
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('source', help='video file or directory of frames')
+    parser.add_argument('--frames', type=int, default=200)
+    parser.add_argument('--scale', type=float, default=0.5)
+    parser.add_argument('--intervals', type=int, nargs='+', default=[1, 2, 4, 8, 12, 16])
+    args = parser.parse_args()
+
+    frames = loadFrames(args.source, args.frames, args.scale)
+    grays = [cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) for frame in frames]
+    # Flow is computed on every frame whatever the interval (the knife pipeline needs it
+    # anyway), so it is left out of the timings
+    engine = FarnebackFlow()
+    flows = [engine.compute(prev, gray) for prev, gray in zip(grays, grays[1:])]
+
+    hog = cv2.HOGDescriptor()
+    hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+    start = timeit.default_timer()
+    detections = [detectPeople(hog, frame) for frame in frames]
+    detectTime = (timeit.default_timer() - start)/len(frames)
+    print('%d frames of %dx%d, detector %.2f ms/frame' % (len(frames), frames[0].shape[1], frames[0].shape[0],
+                                                          1000*detectTime))
+
+    print('\ninterval  ms/frame  speed-up  detector runs  scheduled  forced (confidence, motion)  mean IoU')
+    referenceTime = None
+    for interval in args.intervals:
+        elapsed, stats, overlaps = run(frames, flows, detections, interval, lambda frame: detectPeople(hog, frame))
+        referenceTime = referenceTime or elapsed
+        print('%8d %9.2f %8.2fx %7d (%3.0f%%) %10d %7d (%d, %d) %21s' % (
+            interval, 1000*elapsed, referenceTime/elapsed, stats['keyframes'],
+            100.0*stats['keyframes']/len(frames), stats['scheduled'], stats['forced'],
+            stats['forced_confidence'], stats['forced_motion'],
+            '%.3f' % np.mean(overlaps) if overlaps else '-'))
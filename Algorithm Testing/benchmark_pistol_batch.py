@@ -0,0 +1,48 @@
+# Pistol classifier latency against the number of people in the frame:
+# one sess.run per person crop (old behaviour) vs one batched sess.run.
+# Run from the repository root; export the batchable graph first with
+#   python -m detectors.pistol_export
+from __future__ import print_function
+import os
+import sys
+import timeit
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from detectors.pistol_detector import PistolDetector
+from detectors.pistol_export import isBatchable, INPUT_NAME, OUTPUT_NAME, INPUT_SIZE
+
+
+def timeRuns(fn, repeats):
+    fn() # warm up
+    start = timeit.default_timer()
+    for _ in range(repeats):
+        fn()
+    return (timeit.default_timer() - start)/repeats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--max-people', type=int, default=8)
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    sess = PistolDetector.initialSetup()
+    softmax = sess.graph.get_tensor_by_name(OUTPUT_NAME + ':0')
+    inputs = sess.graph.get_tensor_by_name(INPUT_NAME + ':0')
+    batchable = isBatchable(sess.graph)
+    if not batchable:
+        print('Graph is not batchable, only timing one run per person')
+
+    print('people  per-person run (s)  batched run (s)  speed-up')
+    for people in range(1, args.max_people + 1):
+        crops = np.random.uniform(-0.5, 0.5, (people, INPUT_SIZE, INPUT_SIZE, 3)).astype(np.float32)
+        looped = timeRuns(lambda: [sess.run(softmax, {inputs: crops[i:i+1]}) for i in range(people)], args.repeats)
+        if batchable:
+            batched = timeRuns(lambda: sess.run(softmax, {inputs: crops}), args.repeats)
+            print('%6d  %18.3f  %15.3f  %7.2fx' % (people, looped, batched, looped/batched))
+        else:
+            print('%6d  %18.3f  %15s' % (people, looped, '-'))
@@ -0,0 +1,90 @@
+# Stripe-partitioned Farneback (utils/flow_engine.StripedFlow) against one call over the whole
+# frame: time per frame from 1 to N stripes/threads, and the largest difference in per-person
+# mean motion a stripe seam causes, for a few overlaps. People are an N x N grid of cells.
+# Frames are kept at full resolution by default, striping is meant for large frames.
+# Run from the repository root.
+from __future__ import print_function
+import os
+import sys
+import timeit
+import argparse
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from utils.flow_engine import FarnebackFlow, StripedFlow, STRIPE_OVERLAP
+from utils.replay_source import openSource, FAST
+
+# Largest acceptable difference in a person's mean flow magnitude, in pixels
+TOLERANCE = 0.06
+
+
+def loadGrays(source, count, scale):
+    cap = openSource(source, clock=FAST)
+    grays = []
+    while len(grays) < count:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if scale != 1.0:
+            frame = cv2.resize(frame, None, fx=scale, fy=scale)
+        grays.append(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+    return grays
+
+
+def boxScores(flow, cells):
+    mag, ang = cv2.cartToPolar(flow[..., 0], flow[..., 1])
+    height, width = mag.shape
+    rows = np.linspace(0, height, cells + 1).astype(int)
+    cols = np.linspace(0, width, cells + 1).astype(int)
+    return np.array([mag[top:bottom, left:right].mean() for top, bottom in zip(rows, rows[1:])
+                     for left, right in zip(cols, cols[1:])])
+
+
+def run(engine, grays, cells):
+    flows = []
+    start = timeit.default_timer()
+    for prev, gray in zip(grays, grays[1:]):
+        flows.append(engine.compute(prev, gray))
+    elapsed = (timeit.default_timer() - start)/max(len(grays) - 1, 1)
+    return elapsed, [boxScores(flow, cells) for flow in flows]
+
+
+def maxDifference(scores, reference):
+    return max(np.abs(a - b).max() for a, b in zip(scores, reference))
+
+
+if __name__ == '__main__':
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('source', help='video file or directory of frames')
+    parser.add_argument('--frames', type=int, default=50)
+    parser.add_argument('--scale', type=float, default=1.0)
+    parser.add_argument('--grid', type=int, default=6, help='score an N x N grid of cells')
+    parser.add_argument('--max-stripes', type=int, default=cores)
+    parser.add_argument('--overlaps', type=int, nargs='+', default=[32, 64, 96, STRIPE_OVERLAP, 160])
+    parser.add_argument('--opencv-threads', type=int, default=-1, help='cv2.setNumThreads, -1 keeps the default')
+    args = parser.parse_args()
+
+    if args.opencv_threads >= 0:
+        cv2.setNumThreads(args.opencv_threads)
+    grays = loadGrays(args.source, args.frames, args.scale)
+    print('%d frames of %dx%d, %d cores' % (len(grays), grays[0].shape[1], grays[0].shape[0], cores))
+
+    referenceTime, reference = run(FarnebackFlow(), grays, args.grid)
+    print('whole frame: %.2f ms/frame' % (1000*referenceTime))
+
+    print('\nstripes  ms/frame  speed-up  max diff (px)    overlap %d' % STRIPE_OVERLAP)
+    for stripes in range(1, args.max_stripes + 1):
+        elapsed, scores = run(StripedFlow(stripes=stripes), grays, args.grid)
+        print('%7d %9.2f %8.2fx %14.4f' % (stripes, 1000*elapsed, referenceTime/elapsed,
+                                           maxDifference(scores, reference)))
+
+    stripes = max(args.max_stripes, 2)
+    print('\noverlap  max diff (px)  within %.2f px    %d stripes' % (TOLERANCE, stripes))
+    for overlap in args.overlaps:
+        elapsed, scores = run(StripedFlow(stripes=stripes, overlap=overlap), grays, args.grid)
+        difference = maxDifference(scores, reference)
+        print('%7d %14.4f %13s' % (overlap, difference, 'yes' if difference <= TOLERANCE else 'no'))
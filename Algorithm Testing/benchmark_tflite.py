@@ -0,0 +1,111 @@
+# Frozen graph (TensorFlow) vs int8 TFLite (detectors/tflite_export.py) for the person and
+# knife SSDs: time per frame, and how well the TFLite detections agree with TensorFlow's.
+# A detection agrees if the other backend has one of the same class with IoU >= 0.5.
+# Run from the repository root.
+from __future__ import print_function
+import os
+import sys
+import timeit
+import argparse
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from objects import cnnDetector
+from objects import humanDetector
+from objects.cnnDetector import CNNDetector
+from objects.humanDetector import HumanDetector
+from object_detection.utils import np_box_ops
+from utils.replay_source import openSource, FAST
+
+SCALE = 0.3
+THRESH = 0.3
+MATCH_IOU = 0.5
+
+
+def loadFrames(source, count):
+    cap = openSource(source, clock=FAST)
+    frames = []
+    while len(frames) < count:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(cv2.resize(frame, None, fx=SCALE, fy=SCALE))
+    return frames
+
+
+def personDetections(detector):
+    def detect(frame):
+        output = detector.run(frame)
+        boxes = np.squeeze(output['detection_boxes'], axis=0)
+        scores = np.squeeze(output['detection_scores'], axis=0)
+        classes = np.squeeze(output['detection_classes'], axis=0).astype(np.int32)
+        keep = scores > THRESH
+        return boxes[keep], classes[keep], scores[keep]
+    return detect
+
+
+def knifeDetections(detector):
+    def detect(frame):
+        detections = detector.detect(frame)
+        return (np.array([d.box for d in detections]).reshape(-1, 4), np.array([d.class_id for d in detections]),
+                np.array([d.score for d in detections]))
+    return detect
+
+
+def matches(a, b):
+    # Detections in a that have a same-class partner in b
+    boxesA, classesA, _ = a
+    boxesB, classesB, _ = b
+    if len(boxesA) == 0 or len(boxesB) == 0:
+        return 0
+    iou = np_box_ops.iou(boxesA.astype(np.float64), boxesB.astype(np.float64))
+    iou[classesA[:, None] != classesB[None, :]] = 0
+    return int(np.count_nonzero(iou.max(axis=1) >= MATCH_IOU))
+
+
+def timeFrames(fn, frames):
+    fn(frames[0]) # warm up
+    times = []
+    results = []
+    for frame in frames:
+        start = timeit.default_timer()
+        results.append(fn(frame))
+        times.append(timeit.default_timer() - start)
+    return np.array(times), results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('source', help='video file or directory of frames')
+    parser.add_argument('--frames', type=int, default=200)
+    args = parser.parse_args()
+
+    frames = loadFrames(args.source, args.frames)
+    models = [('person', personDetections(HumanDetector(THRESH)),
+               personDetections(HumanDetector(THRESH, tflite_path=humanDetector.tflite_model_path))),
+              ('knife', knifeDetections(CNNDetector(min_score_thresh=THRESH)),
+               knifeDetections(CNNDetector(min_score_thresh=THRESH, tflite_path=cnnDetector.PATH_TO_TFLITE)))]
+
+    print('%-7s %-7s %9s %9s %9s %10s %10s %11s' % ('model', 'backend', 'mean (s)', 'median', 'p95',
+        'detections', 'agreement', 'score diff'))
+    for name, tfDetect, tfliteDetect in models:
+        tfTimes, tfResults = timeFrames(tfDetect, frames)
+        tfliteTimes, tfliteResults = timeFrames(tfliteDetect, frames)
+
+        tfCount = sum(len(r[0]) for r in tfResults)
+        tfliteCount = sum(len(r[0]) for r in tfliteResults)
+        # Recall of TFLite against TensorFlow, and precision of TFLite against TensorFlow
+        found = sum(matches(a, b) for a, b in zip(tfResults, tfliteResults))
+        kept = sum(matches(b, a) for a, b in zip(tfResults, tfliteResults))
+        # Difference of the best score per frame
+        scoreDiff = np.mean([abs(max(list(a[2]) + [0]) - max(list(b[2]) + [0])) for a, b in zip(tfResults, tfliteResults)])
+
+        print('%-7s %-7s %9.4f %9.4f %9.4f %10d %10s %11s' % (name, 'tf', tfTimes.mean(), np.median(tfTimes),
+            np.percentile(tfTimes, 95), tfCount, '', ''))
+        print('%-7s %-7s %9.4f %9.4f %9.4f %10d %4.0f%%/%3.0f%% %11.3f' % (name, 'tflite', tfliteTimes.mean(),
+            np.median(tfliteTimes), np.percentile(tfliteTimes, 95), tfliteCount,
+            100.0*found/max(tfCount, 1), 100.0*kept/max(tfliteCount, 1), scoreDiff))
+    print('agreement: share of TensorFlow detections TFLite found / share of TFLite detections TensorFlow also made')
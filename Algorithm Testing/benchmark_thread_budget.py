@@ -0,0 +1,68 @@
+# Sweeps thread budgets (TensorFlow intra/inter op threads per session, OpenCV threads)
+# for a given number of cameras and reports the total frames per second each one gets
+# out of detectors/stream_manager.py. Every budget runs in a fresh process, since
+# TensorFlow fixes its pool sizes once the first session exists. Run from the repository root.
+from __future__ import print_function
+import os
+import sys
+import time
+import argparse
+import itertools
+import multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from utils.thread_budget import ThreadBudget, budgetFor
+from utils.replay_source import FAST
+
+WARMUP = 5
+
+
+def runBudget(budget, source, cameras, detectors, duration, results):
+    from detectors.stream_manager import StreamManager
+
+    manager = StreamManager([source]*cameras, detectors, clock=FAST, budget=budget)
+    manager.start()
+    time.sleep(WARMUP)
+    before = sum(stats['processed'] for stats in manager.getStats())
+    time.sleep(duration)
+    after = sum(stats['processed'] for stats in manager.getStats())
+    latency = max(stats['latency'] for stats in manager.getStats())
+    manager.stop()
+    results.put(((after - before)/float(duration), latency))
+
+
+def candidates(cores):
+    threads = sorted(set([1, 2, 4, cores//2, cores]) - set([0]))
+    for intra, inter, opencv in itertools.product(threads, (1, 2), (0, 1, -1)):
+        if intra <= cores:
+            yield ThreadBudget(intra, inter, opencv)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('source', help='video file or directory of frames, replayed on every camera')
+    parser.add_argument('--cameras', type=int, default=2)
+    parser.add_argument('--detectors', nargs='+', default=['knife', 'pistol'])
+    parser.add_argument('--duration', type=float, default=20, help='seconds measured per budget')
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('spawn')
+    cores = os.cpu_count()
+    budgets = [ThreadBudget(), budgetFor(args.cameras*len(args.detectors), cores)] + list(candidates(cores))
+
+    print('%d cameras, %d cores' % (args.cameras, cores))
+    print('%-6s %-6s %-7s %9s %12s' % ('intra', 'inter', 'opencv', 'fps', 'latency (s)'))
+    best = None
+    for budget in budgets:
+        results = context.Queue()
+        process = context.Process(target=runBudget,
+            args=(budget, args.source, args.cameras, args.detectors, args.duration, results))
+        process.start()
+        fps, latency = results.get()
+        process.join()
+        print('%-6d %-6d %-7d %9.1f %12.3f' % (budget.intra_op, budget.inter_op, budget.opencv, fps, latency))
+        if best is None or fps > best[1]:
+            best = (budget, fps)
+
+    print('best: %s at %.1f fps' % best)
@@ -21,16 +21,23 @@ from IPython.display import clear_output
 
 from detectors.opticalflow_detector import OpticalflowDetector
 from detectors.pistol_detector import PistolDetector
+from detectors.model_loader import ModelLoader
+from utils.frame_hub import FrameHub
+from utils.replay_source import openSource, CLOCKS, REALTIME
+from utils.gamma import GammaCorrector
 
 camera_port = 0
-camera = cv2.VideoCapture(camera_port)
+# One capture thread owns the camera and fans every frame out to the workers, main() creates it
+hub = None
+# Both workers brighten the camera's frames the same way, the person detections are shared
+gamma = GammaCorrector()
 
 pics = ["white.jpg"]*12
 SIZE = 0
 
 def grabVideoFeed():
-    grabbed, frame = camera.read()
-    return frame if grabbed else None
+    frame = hub.latest() if hub is not None else None
+    return frame.image if frame is not None else None
 
 class ImageViewer(QtWidgets.QWidget):
     def __init__(self, parent = None):
@@ -69,12 +76,21 @@ class WorkerPistol(QtCore.QObject):
         self.alert_flag = True
 
     def work(self):
-        pd = PistolDetector(log_level=logging.DEBUG) 
+        # Parse, open and warm up both graphs in parallel while the spinner shows
+        loader = ModelLoader(['pistol', 'person']).start()
+        models = loader.wait()
+        logger_msg.info(loader.report())
+        pd = PistolDetector(log_level=logging.DEBUG, sess=models['pistol'], humanDetector=models['person'], gamma=gamma) 
         self.VideoSignal.connect(self.image_viewer_pistol.setImage)  
+        subscription = hub.subscribe('Pistol_Detect')
 
         while self.working:
-            ret, frame = camera.read()
-            frame = pd.detect(frame)
+            captured = subscription.read(timeout=1.0)
+            if captured is None:
+                if subscription.exhausted():
+                    break
+                continue
+            frame = pd.detect(captured.image, key=captured.seq)
             frame = cv2.resize(frame, (400, 400))
             color_swapped_image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
             height, width, _ = color_swapped_image.shape
@@ -103,6 +119,9 @@ class WorkerPistol(QtCore.QObject):
 
             clear_output()
 
+        subscription.close()
+        logger_msg.info("Pistol_Detect dropped %d of %d frames" % (subscription.dropped, subscription.received))
+
         self.flag = True
         # self.VideoSignal.emit(QtGui.QImage("white.jpg"))       
         qt_image = QtGui.QImage("gun.jpeg")
@@ -122,13 +141,28 @@ class WorkerKnife(QtCore.QObject):
         self.alert_flag = True
 
     def work(self):
-        ret, frame = camera.read()
-        od = OpticalflowDetector(frame, log_level=logging.DEBUG)
+        # Parse, open and warm up both graphs in parallel while the spinner shows
+        loader = ModelLoader(['knife', 'person']).start()
+        subscription = hub.subscribe('Knife_Detect')
+        models = loader.wait()
+        logger_msg.info(loader.report())
+        # The flow needs a first frame; keep checking the stop flag while there is none
+        captured = None
+        while self.working and captured is None and not subscription.exhausted():
+            captured = subscription.read(timeout=1.0)
+        if captured is not None:
+            od = OpticalflowDetector(captured.image, log_level=logging.DEBUG, cnn=models['knife'],
+                                     humanDetector=models['person'], gamma=gamma)
         self.VideoSignal.connect(self.image_viewer_knife.setImage)  
 
-        while self.working:
-            ret, frame = camera.read()
-            debugImage = od.detect(frame)
+        while self.working and captured is not None:
+            captured = subscription.read(timeout=1.0)
+            if captured is None:
+                if subscription.exhausted():
+                    break
+                continue
+            frame = captured.image
+            debugImage = od.detect(frame, key=captured.seq)
             outputImage = cv2.resize(debugImage, (400, 400))
 
             color_swapped_image = cv2.cvtColor(outputImage, cv2.COLOR_BGR2RGB)
@@ -168,6 +202,9 @@ class WorkerKnife(QtCore.QObject):
             cv2.waitKey(40)
             clear_output()
 
+        subscription.close()
+        logger_msg.info("Knife_Detect dropped %d of %d frames" % (subscription.dropped, subscription.received))
+
         self.flag = True
         # self.VideoSignal.emit(QtGui.QImage("white.jpg"))       
         qt_image = QtGui.QImage("knife.jpg")
@@ -500,7 +537,15 @@ class Window(QtWidgets.QMainWindow):
 
 
 def main():  
-    app = QtWidgets.QApplication(sys.argv)
+    global hub
+    parser = argparse.ArgumentParser(description='Crime detection')
+    parser.add_argument('--source', default=str(camera_port), help='camera index, video file or directory of frames')
+    parser.add_argument('--clock', default=REALTIME, choices=CLOCKS, help='replay pace for recorded sources')
+    args, qt_args = parser.parse_known_args()
+    # The hub reopens the source every time a detector is started again
+    hub = FrameHub(lambda: openSource(args.source, clock=args.clock))
+
+    app = QtWidgets.QApplication(sys.argv[:1] + qt_args)
     app.setWindowIcon(QtGui.QIcon('stop.jpg'))
     window = Window()
     window.show()
@@ -0,0 +1,129 @@
+import time
+import logging
+import threading
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from objects import cnnDetector
+from objects import humanDetector
+from objects.frozenGraph import readGraphDef
+from objects.cnnDetector import CNNDetector
+from objects.fusedDetector import FusedDetector
+from objects.objectDetector import backendFor
+from objects.humanDetector import getSharedHumanDetector, isSharedHumanDetectorLoaded
+from detectors.pistol_detector import PistolDetector
+from detectors.pistol_export import INPUT_SIZE
+
+# A camera frame after the detectors scale it down (640x480 * SCALE)
+WARMUP_SHAPE = (144, 192, 3)
+
+logger = logging.getLogger("Model Loader")
+
+ch = logging.StreamHandler()
+ch.setLevel(logging.DEBUG)
+logger.addHandler(ch)
+
+# path: frozen graph(s) to parse (None when the model does not run on TensorFlow),
+# build: parsed GraphDef(s) -> model with a session,
+# warmup: runs one dummy inference so the first real frame does not pay for it
+ModelSpec = namedtuple('ModelSpec', ['path', 'build', 'warmup'])
+
+
+def warmupPistol(sess):
+    crop = np.zeros((1, INPUT_SIZE, INPUT_SIZE, 3), dtype=np.float32)
+    sess.run('final_result:0', {'Mul:0': crop})
+
+
+MODELS = {
+    'person': ModelSpec(lambda: humanDetector.model_path if backendFor('person') == 'tf' else None,
+                        lambda graph_def: getSharedHumanDetector(graph_def=graph_def),
+                        lambda model: model.detector.run(np.zeros(WARMUP_SHAPE, dtype=np.uint8))),
+    'knife': ModelSpec(lambda: cnnDetector.PATH_TO_CKPT if backendFor('knife') == 'tf' else None,
+                       lambda graph_def: CNNDetector(graph_def),
+                       lambda model: model.detect(np.zeros(WARMUP_SHAPE, dtype=np.uint8))),
+    'pistol': ModelSpec(PistolDetector.graphPath,
+                        PistolDetector.initialSetup,
+                        warmupPistol),
+    'fused': ModelSpec(lambda: (humanDetector.model_path, cnnDetector.PATH_TO_CKPT),
+                       lambda graph_defs: FusedDetector(*graph_defs),
+                       lambda model: model.run(np.zeros(WARMUP_SHAPE, dtype=np.uint8))),
+}
+
+# Models already loaded in this process, shared by every loader
+loaded = {}
+locks = dict((name, threading.Lock()) for name in MODELS)
+
+
+class ModelLoader:
+    # Loads several models in parallel: every model is parsed, given a session and warmed
+    # up on its own thread (protobuf parsing and TensorFlow release the GIL).
+    def __init__ (self, names):
+        for name in names:
+            if name not in MODELS:
+                raise ValueError('Unknown model: %s' % name)
+        self.names = list(names)
+        self.timings = OrderedDict((name, {}) for name in self.names)
+        self.executor = None
+        self.futures = None
+
+    def start(self):
+        self.executor = ThreadPoolExecutor(max_workers=len(self.names))
+        self.futures = OrderedDict((name, self.executor.submit(self.load, name)) for name in self.names)
+        self.executor.shutdown(wait=False)
+        return self
+
+    def wait(self):
+        models = OrderedDict((name, future.result()) for name, future in self.futures.items())
+        logger.info(self.report())
+        return models
+
+    def load(self, name):
+        spec = MODELS[name]
+        timings = self.timings[name]
+        with locks[name]:
+            if name in loaded:
+                timings['cached'] = True
+                return loaded[name]
+            if name == 'person' and isSharedHumanDetectorLoaded():
+                # Someone created the shared person detector without going through the loader
+                loaded[name] = getSharedHumanDetector()
+                timings['cached'] = True
+                return loaded[name]
+
+            start = time.time()
+            path = spec.path()
+            if path is None:
+                graph_def = None
+            elif isinstance(path, tuple):
+                graph_def = [readGraphDef(p) for p in path]
+            else:
+                graph_def = readGraphDef(path)
+            timings['parse'] = time.time() - start
+
+            start = time.time()
+            model = spec.build(graph_def)
+            timings['session'] = time.time() - start
+
+            start = time.time()
+            spec.warmup(model)
+            timings['warmup'] = time.time() - start
+
+            loaded[name] = model
+            return model
+
+    def report(self):
+        lines = []
+        for name, timings in self.timings.items():
+            if timings.get('cached'):
+                lines.append('%s: already loaded' % name)
+            else:
+                lines.append('%s: parse %.2fs, session %.2fs, warm-up %.2fs' % (name,
+                    timings.get('parse', 0), timings.get('session', 0), timings.get('warmup', 0)))
+        return '\n'.join(lines)
+
+
+def loadModels(names):
+    # Blocks until every model is ready, returns {name: model}
+    return ModelLoader(names).start().wait()
@@ -4,18 +4,31 @@ import numpy as np
 import time
 import math
 import logging
+import argparse
 
 from utils.common import *
-
-from objects.cnnDetector import CNNDetector
-from objects.humanDetector import HumanDetector
+from utils.replay_source import openSource, CLOCKS, REALTIME
+from utils.box_tracker import BoxTracker, KeyframeScheduler
+from utils.motion_gate import MotionGate
+from utils.gamma import GammaCorrector
+from utils.vote_counter import VoteCounter
+from utils.flow_engine import createFlowEngine, ENGINES, DEFAULT_ENGINE
+from utils.motion_stats import MotionStats
+from utils.association import associate
+
+from objects.cnnDetector import CNNDetector, Detection
+from objects.humanDetector import getSharedHumanDetector
+from objects.fusedDetector import FusedDetector
 
 SCALE = 0.3
 # maxAverage = -1
 VOTE_THRESH = 5
 PROBABILITY_THRESH = 0.6
-TIME_THRESH = 300000 # 5 mins
-GAMMA_VALUE = 2
+HUMAN_THRESH = 0.3
+# Cascade mode: person crops are grown by this fraction of their size on every side
+# and taken from the full resolution frame at the knife model's input size
+CASCADE_PADDING = 0.25
+CASCADE_SIZE = 400
 
 logger = logging.getLogger("Optical Flow Detector")
 
@@ -24,95 +37,160 @@ ch.setLevel(logging.DEBUG)
 logger.addHandler(ch)
 
 class OpticalflowDetector:
-    def __init__ (self, frame, log_level=logging.DEBUG):
+    def __init__ (self, frame, log_level=logging.DEBUG, cnn=None, humanDetector=None, fused=None, cascade=False,
+                  keyframe_interval=1, motion_gate=False, gamma=None,
+                  flow_engine=DEFAULT_ENGINE):
         logger.setLevel(log_level)
-        frame = cv2.resize(frame,None,fx=SCALE,fy=SCALE)
-        frame = self.adjust_gamma(frame, gamma=GAMMA_VALUE)
+        if fused is not None and cascade:
+            raise ValueError('The fused detector always runs the knife model on the whole frame, it cannot cascade')
+        # Lowered by utils/quality_controller.py through setQuality() when the box is busy
+        self.scale = SCALE
+        self.stride = 1
+        self.sinceFlow = 0
+        # Low light enhancement, shared with the other detectors on the stream if handed in
+        self.gamma = gamma if gamma is not None else GammaCorrector()
+        frame = cv2.resize(frame,None,fx=self.scale,fy=self.scale)
+        frame = self.gamma.correct(frame)
 
         self.prevgray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        # Name from utils/flow_engine.ENGINES (or an engine)
+        self.flowEngine = createFlowEngine(flow_engine)
+        # Boxes of the people and knives after the last locate(), replaced as a whole so the
+        # flow stage of detectors/opticalflow_pipeline.py can read them while locate() runs
+        self.trackedBoxes = []
         self.fps_time = 0
-        self.cnn = CNNDetector()
-        self.humanDetector = HumanDetector(0.3)
-        self.votes = []
-
-    def adjust_gamma(self, image, gamma=1.0):
-        # build a lookup table mapping the pixel values [0, 255] to
-        # their adjusted gamma values
-        invGamma = 1.0 / gamma
-        table = np.array([((i / 255.0) ** invGamma) * 255
-            for i in np.arange(0, 256)]).astype("uint8")
-    
-        # apply gamma correction using the lookup table
-        return cv2.LUT(image, table)
-
-
-    def detect(self, frame):
+        # Models can be handed in so that several streams share one copy of each
+        self.fused = fused
+        if fused is not None:
+            # Person and knife come out of one sess.run; a shared person detector, if given,
+            # only receives the person results for the pistol detector to reuse
+            self.cnn = cnn
+            self.humanDetector = humanDetector
+        else:
+            self.cnn = cnn if cnn is not None else CNNDetector()
+            self.humanDetector = humanDetector if humanDetector is not None else getSharedHumanDetector()
+        self.cascade = cascade
+        # The models only run on keyframes, people and knives are carried along the flow in between
+        self.scheduler = KeyframeScheduler(keyframe_interval)
+        self.keyframeInterval = keyframe_interval
+        self.humanTracker = BoxTracker()
+        self.knifeTracker = BoxTracker()
+        # Static scenes skip every model and show the last result again
+        self.gate = MotionGate() if motion_gate else None
+        self.debugImage = None
+        # Votes of the last few minutes, len() gives the count callers alarm on
+        self.votes = VoteCounter()
+        self.trackVotes = {}
+
+    def detect(self, frame, key=None):
+        # key identifies the camera frame (e.g. its FrameHub sequence number) so that
+        # person detection runs only once per frame across all detectors
         # global maxAverage
-        frame = cv2.resize(frame,None,fx=SCALE,fy=SCALE)
-
-        frame = self.adjust_gamma(frame, gamma=GAMMA_VALUE)
+        self.sinceFlow += 1
+        if self.sinceFlow < self.stride and self.debugImage is not None:
+            return self.debugImage
+        if self.gate is not None and not self.gate.check(frame):
+            return self.debugImage
 
-        debugImage = frame.copy()
+        # The stages below are also run on separate threads by detectors/opticalflow_pipeline.py
+        original, frame, gray = self.preprocess(frame, key)
+        flow, mag = self.computeFlow(gray)
+        humans, knifeBoxes = self.locate(original, frame, flow, mag, key)
+        return self.fuse(frame, flow, mag, humans, knifeBoxes)
 
-        height, width, channels = frame.shape
-        grayVelocity = np.zeros([height, width, 1], dtype=np.uint8)
+    def preprocess(self, frame, key=None):
+        original = frame
+        frame = cv2.resize(frame,None,fx=self.scale,fy=self.scale)
 
-        # Everything is phased out by one frame
-        knifeBoxes = self.cnn.detect(frame)
-        humans = self.humanDetector.detect(frame)
+        frame = self.gamma.correct(frame, key)
 
         # convert image to grayscale
         gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        sample_rate = 3
-        flow = cv2.calcOpticalFlowFarneback(self.prevgray, gray, None, 0.5, 3, 15, sample_rate, 5, 1.2, 0)
+        return original, frame, gray
+
+    def computeFlow(self, gray, gap=None, boxes=None):
+        # gap: frames since the last flow, counted by the caller if it drops frames itself;
+        # boxes: where local flow engines look, the last tracked boxes by default
+        if self.prevgray.shape != gray.shape:
+            # The scale changed since the last frame
+            self.prevgray = cv2.resize(self.prevgray, (gray.shape[1], gray.shape[0]))
+        if not self.flowEngine.local:
+            boxes = []
+        elif boxes is None:
+            # Only the tracked people and knives are needed, in their last known places
+            boxes = self.trackedBoxes
+        flow = self.flowEngine.compute(self.prevgray, gray, boxes)
 
         mag, ang = cv2.cartToPolar(flow[...,0], flow[...,1])
+        # Motion scores are tuned for SCALE and consecutive frames; the flow itself stays in
+        # pixels of this frame for the trackers
+        gap = max(self.sinceFlow if gap is None else gap, 1)
+        self.sinceFlow = 0
+        if self.scale != SCALE or gap > 1:
+            mag *= SCALE/(self.scale*gap)
 
-        grayVelocity[...,0] = cv2.normalize(mag,None,0,255,cv2.NORM_MINMAX) 
-        # Deprecated, we dont need the normalised grayscale
-
-        # Erase entire array when latest data is stale
-        if (len(self.votes) >= 1):
-            if (time.time() - self.votes[-1] > TIME_THRESH):
-                self.votes = []
-
-        for human in humans:
-            knifeConfidence = 0
-
-            humanRect = human
-            humanBox = [0,0,0,0]
-            # Convert knife rect
-            humanBox[0] = int(humanRect[1]*width) # xmin
-            humanBox[1] = int(humanRect[0]*height) # ymin
-            humanBox[2] = int(humanRect[3]*width) # xmax
-            humanBox[3] = int(humanRect[2]*height) # ymax
-
-            cv2.rectangle(debugImage, (humanBox[0], humanBox[1]), (humanBox[2], humanBox[3]), (0, 255, 255), 1)
-            cv2.rectangle(grayVelocity, (humanBox[0], humanBox[1]), (humanBox[2], humanBox[3]), (255), 1)
-
-            humanBoxArea = (humanBox[2] - humanBox[0])*(humanBox[3] - humanBox[1])
+        # Update the previous
+        self.prevgray = gray
+        return flow, mag
+
+    def locate(self, original, frame, flow, mag, key=None):
+        # Returns the people as (track id, box) pairs and the knife detections for this frame
+        confidence = min(self.humanTracker.minConfidence(), self.knifeTracker.minConfidence())
+        if self.scheduler.isKeyframe(confidence, float(mag.mean())):
+            # Everything is phased out by one frame
+            if self.fused is not None:
+                humans, knifeBoxes = self.fused.detect(frame, HUMAN_THRESH, shared=self.humanDetector, key=key)
+            elif self.cascade:
+                humans = self.humanDetector.detect(frame, key=key, min_score_thresh=HUMAN_THRESH)
+                knifeBoxes = self.detectKnivesOnPeople(original, humans, key)
+            else:
+                knifeBoxes = self.cnn.detect(frame)
+                humans = self.humanDetector.detect(frame, key=key, min_score_thresh=HUMAN_THRESH)
+
+            self.humanTracker.reset(humans)
+            for track, knife in zip(self.knifeTracker.reset([knife.box for knife in knifeBoxes]), knifeBoxes):
+                track.data['detection'] = knife
+        else:
+            self.humanTracker.propagateFlow(flow)
+            self.knifeTracker.propagateFlow(flow)
+            knifeBoxes = [Detection(track.data['detection'].class_id, track.data['detection'].score, track.box)
+                          for track in self.knifeTracker.tracks]
+        # Tracks keep moving with later frames, so only their current boxes are handed on
+        humans = [(track.trackId, track.box) for track in self.humanTracker.tracks]
+        self.trackedBoxes = [box for trackId, box in humans] + [knife.box for knife in knifeBoxes]
+        return humans, knifeBoxes
+
+    def fuse(self, frame, flow, mag, humans, knifeBoxes):
+        debugImage = frame.copy()
 
-            for knife in knifeBoxes:
-                knifeRect = knife[2]
-                knifeBox = [0,0,0,0]
-                # Convert knife rect
-                knifeBox[0] = int(knifeRect[1]*width) # xmin
-                knifeBox[1] = int(knifeRect[0]*height) # ymin
-                knifeBox[2] = int(knifeRect[3]*width) # xmax
-                knifeBox[3] = int(knifeRect[2]*height) # ymax
-                cv2.rectangle(debugImage, (knifeBox[0], knifeBox[1]), (knifeBox[2], knifeBox[3]), (0, 0, 255), 2)
+        height, width, channels = frame.shape
+        grayVelocity = np.zeros([height, width, 1], dtype=np.uint8)
 
-                if (isIntersect(humanBox, knifeBox)):
-                    knifeConfidence = max(knifeConfidence, knife[1])
+        grayVelocity[...,0] = cv2.normalize(mag,None,0,255,cv2.NORM_MINMAX) 
+        # Deprecated, we dont need the normalised grayscale
 
-            croppedImage = mag[humanBox[0]:humanBox[2], humanBox[1]:humanBox[3]]
-            average = croppedImage.mean(axis=0).mean(axis=0)
+        humanBoxes = np.array([humanRect for trackId, humanRect in humans]).reshape(-1, 4)
+        knifeRects = np.array([knife.box for knife in knifeBoxes]).reshape(-1, 4)
+        # Every person against every knife in one go
+        association = associate(humanBoxes, knifeRects, [knife.score for knife in knifeBoxes])
+        # Mean motion inside every person, from one summed-area table of the frame
+        motion = MotionStats(mag).means(humanBoxes)
+
+        # Normalised (ymin, xmin, ymax, xmax) to pixels
+        toPixels = np.array([height, width, height, width])
+        for ymin, xmin, ymax, xmax in (knifeRects*toPixels).astype(int).tolist():
+            cv2.rectangle(debugImage, (xmin, ymin), (xmax, ymax), (0, 0, 255), 2)
+
+        humanPixels = (humanBoxes*toPixels).astype(int).tolist()
+        for (trackId, humanRect), humanBox, average, knifeConfidence in zip(humans, humanPixels, motion,
+                                                                            association.confidence):
+            ymin, xmin, ymax, xmax = humanBox
+            cv2.rectangle(debugImage, (xmin, ymin), (xmax, ymax), (0, 255, 255), 1)
+            cv2.rectangle(grayVelocity, (xmin, ymin), (xmax, ymax), (255), 1)
 
             # if average > maxAverage:
                # maxAverage = average
 
-            if (math.isnan(average)):
-                average = 0
             # Divide so that the closer the person is, the less likely he'll be giving off the false signal
             logger.info("=======================")
             logger.info('knife confidence intersecting with human: ' + str(knifeConfidence))
@@ -125,11 +203,12 @@ class OpticalflowDetector:
             pr = average/18 + (knifeConfidence)/2
             logger.info('combined pr: ' + str(pr))
             if (pr > PROBABILITY_THRESH):
-                self.votes.append(time.time())
-
-        # Update the previous
-        self.prevgray = gray
+                self.votes.add()
+                self.trackVotes[trackId] = self.trackVotes.get(trackId, 0) + 1
 
+        # Only people still being tracked keep their tally
+        self.trackVotes = dict((trackId, self.trackVotes[trackId])
+                               for trackId, humanRect in humans if trackId in self.trackVotes)
 
         # For every human bounding box, find out if there is high activity within that area and if the knife overlaps it
         cv2.putText(debugImage, 
@@ -141,28 +220,78 @@ class OpticalflowDetector:
         draw_flow(debugImage, flow)
 
         self.fps_time = time.time()
+        self.debugImage = debugImage
 
         return debugImage
 
+    def detectKnivesOnPeople(self, image, humans, key=None):
+        # A knife only counts where it meets a person, so the knife model is skipped on
+        # empty scenes and otherwise only sees the (padded) people, in one batch
+        if len(humans) == 0:
+            return []
+
+        crops, regions = cropRegions(image, humans, CASCADE_PADDING, CASCADE_SIZE)
+        crops = [self.gamma.apply(crop, key) for crop in crops]
+
+        knifeBoxes = []
+        for detections, region in zip(self.cnn.detect_batch(crops), regions):
+            for detection in detections:
+                knifeBoxes.append(Detection(detection.class_id, detection.score, mapToFrame(detection.box, region)))
+        return knifeBoxes
+
     def getVotes(self):
-        # With this array, we can sort by timing, do range queries, and find total length of the votes
+        # A utils/vote_counter.VoteCounter: len() is the votes of the last 5 minutes,
+        # count(window)/counts() the votes of its other windows
         return self.votes
 
+    def setQuality(self, quality):
+        # quality: a utils/quality_controller.QualityLevel
+        self.scale = quality.scale
+        self.stride = quality.stride
+        # The level only ever spaces keyframes further apart than the configured interval
+        self.scheduler.interval = max(self.keyframeInterval, quality.keyframe_interval)
+
+    def getTrackVotes(self):
+        # Votes per tracked person, {track id: votes}, carried across interpolated frames
+        return self.trackVotes
+
+    def getKeyframeStats(self):
+        return self.scheduler.getStats()
+
+    def getGateStats(self):
+        return self.gate.getStats() if self.gate is not None else None
+
     def clearVotes(self):
-        self.votes = []
+        self.votes.clear()
+        self.trackVotes = {}
 
 
 # main
 if __name__ == '__main__':
-    
-    cap = cv2.VideoCapture(0)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--source', default='0', help='camera index, video file or directory of frames')
+    parser.add_argument('--clock', default=REALTIME, choices=CLOCKS, help='replay pace for recorded sources')
+    parser.add_argument('--fused', action='store_true', help='run person and knife models in one session')
+    parser.add_argument('--cascade', action='store_true', help='only look for knives on detected people')
+    parser.add_argument('--keyframe-interval', type=int, default=1, help='run the models every N frames, track in between')
+    parser.add_argument('--motion-gate', action='store_true', help='skip the models while the scene does not change')
+    parser.add_argument('--flow', default=DEFAULT_ENGINE, choices=sorted(ENGINES), help='optical flow engine')
+    parser.add_argument('--gamma', type=float, default=None, help='fixed gamma correction, estimated per frame by default')
+    args = parser.parse_args()
+
+    cap = openSource(args.source, clock=args.clock)
     ret, frame = cap.read()
     # frame = cv2.resize(frame, (0,0), fx=0.5, fy=0.5) # Scale resizing
 
-    od = OpticalflowDetector(frame, log_level=logging.ERROR)
+    od = OpticalflowDetector(frame, log_level=logging.ERROR, fused=FusedDetector() if args.fused else None,
+                             cascade=args.cascade, keyframe_interval=args.keyframe_interval,
+                             motion_gate=args.motion_gate, gamma=GammaCorrector(args.gamma),
+                             flow_engine=args.flow)
 
     while(True):
         ret, frame = cap.read()
+        if not ret:
+            break
         # frame = cv2.resize(frame, (0,0), fx=0.5, fy=0.5) # Scale resizing
         frame = od.detect(frame)
         if (len(od.getVotes()) >= 5):
@@ -0,0 +1,228 @@
+import sys
+import time
+import queue
+import logging
+import argparse
+import threading
+
+import cv2
+
+from detectors.opticalflow_detector import OpticalflowDetector
+from utils.replay_source import openSource, CLOCKS, REALTIME
+
+# Frames each stage may have waiting in front of it
+QUEUE_DEPTH = 2
+STATS_INTERVAL = 5
+SMOOTHING = 0.1
+
+logger = logging.getLogger("Optical Flow Pipeline")
+
+ch = logging.StreamHandler()
+ch.setLevel(logging.DEBUG)
+logger.addHandler(ch)
+
+
+class StageError(Exception):
+    # A frame a stage failed on. It travels down the remaining stages in place of the
+    # frame and read() raises it, so one bad frame neither kills a thread nor stalls the queues
+    def __init__ (self, stage, error):
+        Exception.__init__(self, 'Stage %s failed: %r' % (stage, error))
+        self.stage = stage
+        self.error = error
+
+
+class Stage:
+    # One thread running fn on everything that arrives in its inbox. fn returns the item
+    # for the next stage, or None to drop it. The bounded inboxes give backpressure:
+    # a stage that falls behind blocks the one before it instead of piling up frames.
+    def __init__ (self, name, fn, outbox, depth=QUEUE_DEPTH):
+        self.name = name
+        self.fn = fn
+        self.inbox = queue.Queue(maxsize=depth)
+        self.outbox = outbox
+        self.processed = 0
+        self.failed = 0
+        self.busyTime = 0
+        self.thread = threading.Thread(target=self.run, name='Pipeline-' + name)
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+
+    def run(self):
+        while True:
+            item = self.inbox.get()
+            if item is None:
+                # Pass the end marker on so every later stage stops too
+                self.outbox.put(None)
+                break
+            if isinstance(item, StageError):
+                self.outbox.put(item)
+                continue
+            start = time.time()
+            try:
+                result = self.fn(*item)
+            except Exception as error:
+                logger.exception('Stage %s failed' % self.name)
+                self.failed += 1
+                result = StageError(self.name, error)
+            self.busyTime = self.busyTime + SMOOTHING*((time.time() - start) - self.busyTime)
+            self.processed += 1
+            if result is not None:
+                self.outbox.put(result)
+
+    def getStats(self):
+        return {'queued': self.inbox.qsize(),
+                'processed': self.processed,
+                'failed': self.failed,
+                'busy_time': self.busyTime}
+
+
+class OpticalflowPipeline:
+    # Runs OpticalflowDetector's stages on their own threads:
+    #   preprocess -> flow -> models/tracking -> fusion/render
+    # so the flow of frame t+1 is computed while the models look at frame t, and
+    # throughput approaches that of the slowest stage rather than the sum of them.
+    # Every stage keeps its own part of the detector's state (prevgray, trackers,
+    # votes). The one thing shared is detector.trackedBoxes: the models stage replaces
+    # that list as a whole after every frame and the flow stage takes the current list,
+    # a snapshot up to a frame or two old, for the local flow engines (sparse, roi).
+    def __init__ (self, detector, depth=QUEUE_DEPTH):
+        self.detector = detector
+        self.results = queue.Queue(maxsize=depth)
+        self.render = Stage('render', self.fuse, self.results, depth)
+        self.models = Stage('models', self.locate, self.render.inbox, depth)
+        self.flow = Stage('flow', self.computeFlow, self.models.inbox, depth)
+        self.preprocess = Stage('preprocess', self.prepare, self.flow.inbox, depth)
+        self.stages = [self.preprocess, self.flow, self.models, self.render]
+        self.submitted = 0
+        self.skipped = 0
+        self.strided = 0
+        self.sinceSubmit = 0
+        # Frames the motion gate held back since the last flow, they widen its gap
+        self.gatedFrames = 0
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+
+    def stop(self):
+        self.preprocess.inbox.put(None)
+        for stage in self.stages:
+            stage.thread.join()
+
+    def submit(self, frame, key=None):
+        # Blocks while the first stage is full. Frames the detector's quality level
+        # strides over never enter the pipeline; returns whether the frame was taken
+        self.sinceSubmit += 1
+        if self.sinceSubmit < self.detector.stride:
+            self.strided += 1
+            return False
+        gap, self.sinceSubmit = self.sinceSubmit, 0
+        self.submitted += 1
+        self.preprocess.inbox.put((frame, key, gap))
+        return True
+
+    def read(self, timeout=None):
+        # (key, debug image) of the next finished frame, None once the pipeline has stopped.
+        # Raises StageError for a frame one of the stages failed on
+        result = self.results.get(timeout=timeout)
+        if isinstance(result, StageError):
+            raise result
+        return result
+
+    def prepare(self, frame, key, gap):
+        gate = self.detector.gate
+        if gate is not None and not gate.check(frame):
+            self.skipped += 1
+            self.gatedFrames += gap
+            return None
+        gap, self.gatedFrames = gap + self.gatedFrames, 0
+        original, frame, gray = self.detector.preprocess(frame, key)
+        return key, original, frame, gray, gap
+
+    def computeFlow(self, key, original, frame, gray, gap):
+        # Never the trackers themselves, locate() is moving them on the models thread
+        boxes = self.detector.trackedBoxes
+        flow, mag = self.detector.computeFlow(gray, gap, boxes)
+        return key, original, frame, flow, mag
+
+    def locate(self, key, original, frame, flow, mag):
+        humans, knifeBoxes = self.detector.locate(original, frame, flow, mag, key)
+        return key, frame, flow, mag, humans, knifeBoxes
+
+    def fuse(self, key, frame, flow, mag, humans, knifeBoxes):
+        return key, self.detector.fuse(frame, flow, mag, humans, knifeBoxes)
+
+    def getVotes(self):
+        return self.detector.getVotes()
+
+    def clearVotes(self):
+        self.detector.clearVotes()
+
+    def getStats(self):
+        return {'submitted': self.submitted,
+                'skipped': self.skipped,
+                'strided': self.strided,
+                'results': self.results.qsize(),
+                'stages': [(stage.name, stage.getStats()) for stage in self.stages]}
+
+
+# main
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the optical flow detector as a pipeline of threads')
+    parser.add_argument('--source', default='0', help='camera index, video file or directory of frames')
+    parser.add_argument('--clock', default=REALTIME, choices=CLOCKS, help='replay pace for recorded sources')
+    parser.add_argument('--depth', type=int, default=QUEUE_DEPTH, help='frames queued in front of each stage')
+    parser.add_argument('--show', action='store_true', help='display the debug images')
+    args = parser.parse_args()
+
+    cap = openSource(args.source, clock=args.clock)
+    ret, frame = cap.read()
+    pipeline = OpticalflowPipeline(OpticalflowDetector(frame, log_level=logging.ERROR), args.depth)
+    pipeline.start()
+
+    def feed():
+        seq = 0
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            pipeline.submit(frame, seq)
+            seq += 1
+        pipeline.stop()
+
+    feeder = threading.Thread(target=feed, name='Pipeline-feed')
+    feeder.daemon = True
+    feeder.start()
+
+    start = time.time()
+    lastStats = start
+    done = 0
+    while True:
+        try:
+            result = pipeline.read()
+        except StageError:
+            # Logged by the stage, the pipeline carries on with the next frame
+            continue
+        if result is None:
+            break
+        key, debugImage = result
+        done += 1
+        if len(pipeline.getVotes()) >= 5:
+            print("Notified")
+            pipeline.clearVotes()
+
+        if args.show:
+            cv2.imshow('image', debugImage)
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                break
+
+        if time.time() - lastStats >= STATS_INTERVAL:
+            lastStats = time.time()
+            stats = pipeline.getStats()
+            print('%.1f fps, ' % (done/(lastStats - start)) + ', '.join('%s: %d queued %.3fs' % (name,
+                stage['queued'], stage['busy_time']) for name, stage in stats['stages']))
+
+    cv2.destroyAllWindows()
+    sys.exit(0)
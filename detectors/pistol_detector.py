@@ -7,16 +7,26 @@ import timeit
 import time
 import math
 import logging
-
-from objects.humanDetector import HumanDetector
+import argparse
+
+from objects.humanDetector import getSharedHumanDetector
+from objects.frozenGraph import readGraphDef, importGraph
+from detectors.pistol_export import isBatchable, GRAPH_PATH, BATCH_GRAPH_PATH, INPUT_SIZE
+from utils.replay_source import openSource, CLOCKS, REALTIME
+from utils.box_tracker import BoxTracker, KeyframeScheduler
+from utils.motion_gate import MotionGate
+from utils.gamma import GammaCorrector
+from utils.vote_counter import VoteCounter
+from utils.thread_budget import sessionConfig
+from utils.crop_batch import CropBatch
 
 label_lines = [line.rstrip() for line
            in tf.gfile.GFile('./data/labels/gun_labels.txt')]
 
 SCALE = 0.3
 SCORE_THRESH = 0.4
-TIME_THRESH = 300000 # 5 mins
-GAMMA_VALUE = 2
+HUMAN_THRESH = 0.3
+HANDGUN_LABEL = "person handgun"
 
 logger = logging.getLogger("Pistol Detector")
 logger.setLevel(logging.DEBUG)
@@ -26,64 +36,105 @@ ch.setLevel(logging.DEBUG)
 logger.addHandler(ch)
 
 class PistolDetector:
-    def __init__ (self, log_level=logging.DEBUG):
+    def __init__ (self, log_level=logging.DEBUG, sess=None, humanDetector=None, keyframe_interval=1, motion_gate=False,
+                  gamma=None):
         logger.setLevel(log_level)
-        self.initialSetup()
-        self.sess = tf.Session()
+        # Pass in an existing session/human detector to share the models between streams
+        if sess is None:
+            sess = self.initialSetup()
+        self.sess = sess
         self.start_time = timeit.default_timer()
 
         self.softmax_tensor = self.sess.graph.get_tensor_by_name('final_result:0')
+        self.input_tensor = self.sess.graph.get_tensor_by_name('Mul:0')
+        self.batchable = isBatchable(self.sess.graph)
+        if not self.batchable:
+            logger.warning('Pistol graph takes one crop at a time, run detectors/pistol_export.py to batch them')
+        self.handgun_id = label_lines.index(HANDGUN_LABEL)
         logger.info('Took {} seconds to feed data to graph'.format(timeit.default_timer() - self.start_time))
         
-        self.hd = HumanDetector(0.3)
-        self.votes = []
-
-
-    def initialSetup(self):
+        self.hd = humanDetector if humanDetector is not None else getSharedHumanDetector()
+        # Low light enhancement, shared with the other detectors on the stream if handed in
+        self.gamma = gamma if gamma is not None else GammaCorrector()
+        # Person crops are resized and normalised straight into one reused float32 batch
+        self.cropBatch = CropBatch(INPUT_SIZE)
+        # People are only detected and classified on keyframes and tracked in between
+        self.scheduler = KeyframeScheduler(keyframe_interval)
+        self.keyframeInterval = keyframe_interval
+        self.tracker = BoxTracker()
+        self.prevgray = None
+        # Lowered by utils/quality_controller.py through setQuality() when the box is busy
+        self.scale = SCALE
+        self.stride = 1
+        self.sinceRun = 0
+        # Static scenes skip every model and show the last result again
+        self.gate = MotionGate() if motion_gate else None
+        self.debugImage = None
+        # Votes of the last few minutes, len() gives the count callers alarm on
+        self.votes = VoteCounter()
+        self.trackVotes = {}
+
+
+    @staticmethod
+    def graphPath():
+        # Prefer the exported graph that classifies crops in batches
+        return BATCH_GRAPH_PATH if os.path.exists(BATCH_GRAPH_PATH) else GRAPH_PATH
+
+    @staticmethod
+    def initialSetup(graph_def=None):
+        # Returns a session on the classifier graph. graph_def can be handed in
+        # already parsed, e.g. by detectors/model_loader.py
         os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
         start_time = timeit.default_timer()
 
         # This takes 2-5 seconds to run
         # Unpersists graph from file
-        with tf.gfile.FastGFile('./data/models/gun_model/retrained_graph_gun.pb', 'rb') as f:
-            graph_def = tf.GraphDef()
-            graph_def.ParseFromString(f.read())
-            tf.import_graph_def(graph_def, name='')
+        if graph_def is None:
+            graph_def = readGraphDef(PistolDetector.graphPath())
+        graph = importGraph(graph_def)
     
         logger.info('Took {} seconds to unpersist the graph'.format(timeit.default_timer() - start_time))
+        return tf.Session(graph=graph, config=sessionConfig('pistol'))
 
-    def adjust_gamma(self, image, gamma=1.0):
-        # build a lookup table mapping the pixel values [0, 255] to
-        # their adjusted gamma values
-        invGamma = 1.0 / gamma
-        table = np.array([((i / 255.0) ** invGamma) * 255
-            for i in np.arange(0, 256)]).astype("uint8")
-    
-        # apply gamma correction using the lookup table
-        return cv2.LUT(image, table)
-
-
-    def detect(self, frame):
+    def detect(self, frame, key=None):
+        # key identifies the camera frame so the shared person detection runs once per frame
         if frame is None:
             raise SystemError('Issue grabbing the frame')
-        
-        frame = cv2.resize(frame,None,fx=SCALE,fy=SCALE)
-        frame = self.adjust_gamma(frame, gamma=GAMMA_VALUE)
+        self.sinceRun += 1
+        if self.sinceRun < self.stride and self.debugImage is not None:
+            return self.debugImage
+        self.sinceRun = 0
+        if self.gate is not None and not self.gate.check(frame):
+            return self.debugImage
+
+        frame = cv2.resize(frame,None,fx=self.scale,fy=self.scale)
+        frame = self.gamma.correct(frame, key)
         debugImage = frame.copy()
-
-        humans = self.hd.detect(frame)
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if self.prevgray is not None and self.prevgray.shape != gray.shape:
+            # The scale changed, start over from a keyframe
+            self.prevgray = None
+
+        # Frame differencing is enough to notice a sudden burst of motion
+        motion = float(cv2.absdiff(self.prevgray, gray).mean()) if self.prevgray is not None else None
+        confidence = self.tracker.minConfidence() if self.prevgray is not None else 0.0
+        keyframe = self.scheduler.isKeyframe(confidence, motion)
+        if keyframe:
+            humans = self.hd.detect(frame, key=key, min_score_thresh=HUMAN_THRESH)
+            self.tracker.reset(humans)
+        else:
+            self.tracker.propagateSparse(self.prevgray, gray)
+        self.prevgray = gray
+        tracks = self.tracker.tracks
 
         # TODO: Do the cropping here
         height, width, channels = frame.shape
 
-        if (len(self.votes) >= 1):
-            if (time.time() - self.votes[-1] > TIME_THRESH):
-                self.votes = []
-
         highestScore = 0
+        self.cropBatch.reset()
 
-        for human in humans:
-            humanRect = human
+        for track in tracks:
+            humanRect = track.box
             humanBox = [0,0,0,0]
 
             humanBox[0] = int(humanRect[1]*width) # xmin
@@ -104,63 +155,104 @@ class PistolDetector:
 
             crop_img = frame[humanBox[1]:humanBox[1]+h, x_min:x_max]
             cv2.rectangle(debugImage, (x_min, humanBox[1]), (x_max, humanBox[1]+h), (0, 255, 255), 1)
+            if not keyframe:
+                # Between keyframes a person keeps the score of the last classification, and
+                # its verdict keeps voting so alarms come as soon as with every frame classified
+                score = track.data.get('score', 0)
+                highestScore = max([highestScore, score])
+                if (score > SCORE_THRESH):
+                    self.votes.add()
+                    self.trackVotes[track.trackId] = self.trackVotes.get(track.trackId, 0) + 1
+                continue
 
         #     # adhere to TS graph input structure
-            crop_img = cv2.resize(crop_img, (299, 299), interpolation=cv2.INTER_CUBIC)
-
-            numpy_frame = np.asarray(crop_img)
-            numpy_frame = cv2.normalize(numpy_frame.astype('float'), None, -0.5, .5, cv2.NORM_MINMAX)
-            numpy_final = np.expand_dims(numpy_frame, axis=0)
-
-            # This takes 2-5 seconds as well
-            predictions = self.sess.run(self.softmax_tensor, {'Mul:0': numpy_final})
-            
-            # Sort to show labels of first prediction in order of confidence
-            # TODO: Need tot test this on multiple persons, see if the classifier on its own can work on multiple persons
-            # If not then we need to use human detector
-            top_k = predictions[0].argsort()[-len(predictions[0]):][::-1]
-            for node_id in top_k:
-                human_string = label_lines[node_id]
-                if (human_string == "person handgun"):
-                    score = predictions[0][node_id]
-                    logger.info('%s (score = %.5f)' % (human_string, score))
-                    # Get the highest prediction
-                    highestScore = max([highestScore, score])
-                    if (score > SCORE_THRESH):
-                        self.votes.append(time.time())
-                    break
+            self.cropBatch.add(crop_img)
 
-        font = cv2.FONT_HERSHEY_SIMPLEX
-        cv2.putText(debugImage, str(highestScore), (2,10), font, 0.5, (0, 255, 0), 2, cv2.LINE_AA)
+        crops = self.cropBatch.crops()
 
+        self.start_time = timeit.default_timer()
 
-        # frame = cv2.resize(frame, (299, 299), interpolation=cv2.INTER_CUBIC)         
+        # One classifier run for every person in the frame
+        for track, predictions in zip(tracks, self.classify(crops)):
+            score = predictions[self.handgun_id]
+            track.data['score'] = score
+            logger.info('%s (score = %.5f)' % (HANDGUN_LABEL, score))
+            # Get the highest prediction
+            highestScore = max([highestScore, score])
+            if (score > SCORE_THRESH):
+                self.votes.add()
+                self.trackVotes[track.trackId] = self.trackVotes.get(track.trackId, 0) + 1
 
-        self.start_time = timeit.default_timer()
+        # Only people still being tracked keep their tally
+        self.trackVotes = dict((track.trackId, self.trackVotes[track.trackId])
+                               for track in tracks if track.trackId in self.trackVotes)
 
-        logger.info('Took {} seconds to perform prediction'.format(timeit.default_timer() - self.start_time))
+        logger.info('Took {} seconds to classify {} people'.format(timeit.default_timer() - self.start_time, len(crops)))
 
-        self.start_time = timeit.default_timer()
+        font = cv2.FONT_HERSHEY_SIMPLEX
+        cv2.putText(debugImage, str(highestScore), (2,10), font, 0.5, (0, 255, 0), 2, cv2.LINE_AA)
+        self.debugImage = debugImage
 
         return debugImage
 
+    def classify(self, crops):
+        # crops: [n, INPUT_SIZE, INPUT_SIZE, 3] normalised float32 crops, returns one softmax row per crop
+        if len(crops) == 0:
+            return np.zeros((0, len(label_lines)))
+
+        if self.batchable:
+            return self.sess.run(self.softmax_tensor, {self.input_tensor: crops})
+
+        # The original retrained graph is pinned to a batch of one (see detectors/pistol_export.py)
+        return np.concatenate([self.sess.run(self.softmax_tensor, {self.input_tensor: crops[i:i+1]})
+                               for i in range(len(crops))])
+
     def getVotes(self):
-        # With this array, we can sort by timing, do range queries, and find total length of the votes
+        # A utils/vote_counter.VoteCounter: len() is the votes of the last 5 minutes,
+        # count(window)/counts() the votes of its other windows
         return self.votes
 
+    def setQuality(self, quality):
+        # quality: a utils/quality_controller.QualityLevel
+        self.scale = quality.scale
+        self.stride = quality.stride
+        # The level only ever spaces keyframes further apart than the configured interval
+        self.scheduler.interval = max(self.keyframeInterval, quality.keyframe_interval)
+
+    def getTrackVotes(self):
+        # Votes per tracked person, {track id: votes}, carried across interpolated frames
+        return self.trackVotes
+
+    def getKeyframeStats(self):
+        return self.scheduler.getStats()
+
+    def getGateStats(self):
+        return self.gate.getStats() if self.gate is not None else None
+
     def clearVotes(self):
-        self.votes = []
+        self.votes.clear()
+        self.trackVotes = {}
 
 # main
 if __name__ == '__main__':
-    
-    cap = cv2.VideoCapture(0)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--source', default='0', help='camera index, video file or directory of frames')
+    parser.add_argument('--clock', default=REALTIME, choices=CLOCKS, help='replay pace for recorded sources')
+    parser.add_argument('--keyframe-interval', type=int, default=1, help='run the models every N frames, track in between')
+    parser.add_argument('--motion-gate', action='store_true', help='skip the models while the scene does not change')
+    parser.add_argument('--gamma', type=float, default=None, help='fixed gamma correction, estimated per frame by default')
+    args = parser.parse_args()
+
+    cap = openSource(args.source, clock=args.clock)
     ret, frame = cap.read()
 
-    pd = PistolDetector()
+    pd = PistolDetector(keyframe_interval=args.keyframe_interval, motion_gate=args.motion_gate,
+                        gamma=GammaCorrector(args.gamma))
 
     while(True):
         ret, frame = cap.read()
+        if not ret:
+            break
         # frame = cv2.resize(frame, (400, 400))
         frame = pd.detect(frame)
 
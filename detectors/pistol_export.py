@@ -0,0 +1,91 @@
+import sys
+import logging
+import argparse
+
+import numpy as np
+import tensorflow as tf
+
+# The retrained Inception graph is fed at 'Mul:0', whose static shape is [1, 299, 299, 3],
+# and Inception flattens its pool_3 features with a constant [1, 2048] reshape, so it can
+# only ever classify one crop per sess.run. This rewrites both so the batch size is free.
+GRAPH_PATH = './data/models/gun_model/retrained_graph_gun.pb'
+BATCH_GRAPH_PATH = './data/models/gun_model/retrained_graph_gun_batch.pb'
+INPUT_NAME = 'Mul'
+OUTPUT_NAME = 'final_result'
+INPUT_SIZE = 299
+
+logger = logging.getLogger("Pistol Export")
+
+ch = logging.StreamHandler()
+ch.setLevel(logging.DEBUG)
+logger.addHandler(ch)
+
+
+def makeBatchable(graph_def, input_name=INPUT_NAME, output_name=OUTPUT_NAME, size=INPUT_SIZE):
+    consumers = {}
+    for node in graph_def.node:
+        for name in node.input:
+            consumers.setdefault(name.split(':')[0].lstrip('^'), []).append(node)
+
+    output = tf.GraphDef()
+    for node in graph_def.node:
+        if node.name == input_name:
+            # Replace the jpeg decoding/resizing chain with a batch of preprocessed crops
+            placeholder = output.node.add()
+            placeholder.op = 'Placeholder'
+            placeholder.name = input_name
+            placeholder.attr['dtype'].type = tf.float32.as_datatype_enum
+            placeholder.attr['shape'].shape.CopyFrom(tf.TensorShape([None, size, size, 3]).as_proto())
+            continue
+
+        copy = output.node.add()
+        copy.CopyFrom(node)
+
+        # Constant reshape targets with a leading batch dimension of 1 become -1
+        if node.op == 'Const' and any(consumer.op == 'Reshape' and consumer.input[1].split(':')[0] == node.name
+                                      for consumer in consumers.get(node.name, [])):
+            value = tf.make_ndarray(node.attr['value'].tensor)
+            if value.ndim == 1 and value.size > 1 and value[0] == 1:
+                value[0] = -1
+                copy.attr['value'].tensor.CopyFrom(tf.make_tensor_proto(value))
+                logger.info('Freed batch dimension of %s' % node.name)
+
+    # Drop the now unused decoding ops
+    return tf.graph_util.extract_sub_graph(output, [output_name])
+
+
+def isBatchable(graph, input_name=INPUT_NAME):
+    return graph.get_tensor_by_name(input_name + ':0').shape.as_list()[0] is None
+
+
+def exportBatchableGraph(src=GRAPH_PATH, dst=BATCH_GRAPH_PATH):
+    graph_def = tf.GraphDef()
+    with tf.gfile.GFile(src, 'rb') as f:
+        graph_def.ParseFromString(f.read())
+
+    batch_graph_def = makeBatchable(graph_def)
+
+    # Check that a batch really goes through before writing it out
+    with tf.Graph().as_default() as graph:
+        tf.import_graph_def(batch_graph_def, name='')
+        with tf.Session(graph=graph) as sess:
+            crops = np.zeros([2, INPUT_SIZE, INPUT_SIZE, 3], dtype=np.float32)
+            predictions = sess.run(OUTPUT_NAME + ':0', {INPUT_NAME + ':0': crops})
+            if predictions.shape[0] != 2:
+                raise ValueError('Exported graph returned %s for a batch of 2' % (predictions.shape,))
+
+    with tf.gfile.GFile(dst, 'wb') as f:
+        f.write(batch_graph_def.SerializeToString())
+    logger.info('Wrote batchable graph to %s' % dst)
+
+
+# main
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export a pistol classifier graph that accepts batches of crops')
+    parser.add_argument('--src', default=GRAPH_PATH)
+    parser.add_argument('--dst', default=BATCH_GRAPH_PATH)
+    args = parser.parse_args()
+
+    logger.setLevel(logging.INFO)
+    exportBatchableGraph(args.src, args.dst)
+    sys.exit(0)
@@ -0,0 +1,182 @@
+import sys
+import time
+import logging
+import argparse
+import threading
+import multiprocessing
+
+from utils.frame_hub import FrameHub
+from utils.replay_source import openSource, CLOCKS, REALTIME
+from utils.shared_frames import FrameRing
+from utils.thread_budget import ThreadBudget, configure, splitCores
+
+DETECTORS = ('knife', 'pistol')
+RING_SLOTS = 4
+READ_TIMEOUT = 0.5
+STATS_INTERVAL = 5
+
+logger = logging.getLogger("Process Runner")
+
+ch = logging.StreamHandler()
+ch.setLevel(logging.DEBUG)
+logger.addHandler(ch)
+
+
+def detectorProcess(name, ring, index, results, stopEvent, log_level, budget=None):
+    if budget is not None:
+        # Before TensorFlow is imported, so all of its threads inherit the pinning
+        configure(budget)
+
+    # Imported here so that only the worker processes pay for TensorFlow
+    from detectors.opticalflow_detector import OpticalflowDetector
+    from detectors.pistol_detector import PistolDetector
+
+    reader = ring.reader(index)
+    detector = None
+    while not stopEvent.is_set():
+        frame = reader.read(timeout=READ_TIMEOUT)
+        if frame is None:
+            continue
+
+        if detector is None:
+            if name == 'knife':
+                detector = OpticalflowDetector(frame.image, log_level=log_level)
+            else:
+                detector = PistolDetector(log_level=log_level)
+
+        detector.detect(frame.image)
+        # Only metadata goes back, the debug image stays in this process
+        results.put((name, frame.seq, frame.timestamp, time.time(), len(detector.getVotes()), reader.missed))
+    reader.close()
+
+
+class ProcessRunner:
+    # Capture runs in this process, every detector in its own process.
+    # Frames travel through a FrameRing of shared memory slots instead of being pickled.
+    def __init__ (self, source=0, detectors=DETECTORS, clock=REALTIME, slots=RING_SLOTS, pin=False,
+                  log_level=logging.ERROR):
+        for name in detectors:
+            if name not in DETECTORS:
+                raise ValueError('Unknown detector: %s' % name)
+
+        self.source = source
+        self.detectors = detectors
+        self.clock = clock
+        self.slots = slots
+        self.log_level = log_level
+        # Pinned, every detector process gets its own cores and sizes its thread pools to them
+        self.budgets = [None]*len(detectors)
+        if pin:
+            self.budgets = [ThreadBudget(intra_op=len(cores), inter_op=1, opencv=len(cores), cores=cores)
+                            for cores in splitCores(len(detectors))]
+        # spawn, so the workers never inherit a half initialised TensorFlow/OpenCV state
+        self.context = multiprocessing.get_context('spawn')
+        self.hub = None
+        self.subscription = None
+        self.ring = None
+        self.processes = []
+        self.results = None
+        self.stopEvent = None
+        self.publisher = None
+        self.collector = None
+        self.running = False
+        self.stats = dict((name, {'processed': 0, 'missed': 0, 'votes': 0, 'latency': 0}) for name in detectors)
+
+    def start(self):
+        self.hub = FrameHub(lambda: openSource(self.source, clock=self.clock))
+        self.subscription = self.hub.subscribe('ProcessRunner')
+        first = self.subscription.read()
+        if first is None:
+            # The source ran out before it produced a frame, there is nothing to size the ring on
+            logger.error('Source %s ended before the first frame' % (self.source,))
+            self.subscription.close()
+            self.subscription = None
+            return False
+
+        self.ring = FrameRing(self.context, first.image.shape, len(self.detectors), self.slots, first.image.dtype)
+        self.results = self.context.Queue()
+        self.stopEvent = self.context.Event()
+        self.running = True
+
+        for index, name in enumerate(self.detectors):
+            process = self.context.Process(target=detectorProcess, name=name,
+                args=(name, self.ring, index, self.results, self.stopEvent, self.log_level, self.budgets[index]))
+            process.daemon = True
+            process.start()
+            self.processes.append(process)
+
+        self.publisher = threading.Thread(target=self.publish, args=(first,), name='ProcessRunner-publish')
+        self.publisher.daemon = True
+        self.publisher.start()
+        self.collector = threading.Thread(target=self.collect, name='ProcessRunner-collect')
+        self.collector.daemon = True
+        self.collector.start()
+        return True
+
+    def stop(self):
+        if self.subscription is None:
+            return
+        self.running = False
+        self.stopEvent.set()
+        self.publisher.join()
+        for process in self.processes:
+            process.join()
+        self.collector.join()
+        self.subscription.close()
+        self.ring.unlink()
+
+    def publish(self, first):
+        frame = first
+        while self.running:
+            if frame is not None:
+                self.ring.publish(frame)
+            frame = self.subscription.read(timeout=READ_TIMEOUT)
+            if frame is None and self.subscription.exhausted():
+                logger.info('Source %s finished' % (self.source,))
+                break
+
+    def collect(self):
+        while self.running or any(process.is_alive() for process in self.processes):
+            try:
+                name, seq, captured, done, votes, missed = self.results.get(timeout=READ_TIMEOUT)
+            except Exception:
+                continue
+            stats = self.stats[name]
+            stats['processed'] += 1
+            stats['missed'] = missed
+            stats['votes'] = votes
+            stats['latency'] = done - captured
+
+    def getStats(self):
+        return {'captured': self.hub.seq,
+                'published': self.ring.published,
+                'ring_full': self.ring.dropped,
+                'detectors': self.stats}
+
+
+# main
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run each detector in its own process')
+    parser.add_argument('--source', default='0', help='camera index, video file or directory of frames')
+    parser.add_argument('--clock', default=REALTIME, choices=CLOCKS, help='replay pace for recorded sources')
+    parser.add_argument('--detectors', nargs='+', default=list(DETECTORS), choices=DETECTORS)
+    parser.add_argument('--slots', type=int, default=RING_SLOTS, help='shared memory frame slots')
+    parser.add_argument('--pin', action='store_true', help='give every detector process its own cores')
+    args = parser.parse_args()
+
+    runner = ProcessRunner(args.source, args.detectors, args.clock, args.slots, args.pin)
+    if not runner.start():
+        sys.exit(1)
+    start = time.time()
+    try:
+        while True:
+            time.sleep(STATS_INTERVAL)
+            stats = runner.getStats()
+            elapsed = time.time() - start
+            for name, detector in stats['detectors'].items():
+                print('%s: %.1f fps, latency %.3fs, missed %d of %d captured frames, %d votes' % (name,
+                    detector['processed']/elapsed, detector['latency'], detector['missed'],
+                    stats['captured'], detector['votes']))
+    except KeyboardInterrupt:
+        runner.stop()
+        sys.exit(0)
@@ -0,0 +1,320 @@
+import os
+import sys
+import time
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from objects.inferenceBatcher import InferenceBatcher, MAX_WAIT
+from detectors.opticalflow_detector import OpticalflowDetector
+from detectors.pistol_detector import PistolDetector
+from detectors.model_loader import loadModels
+from objects.objectDetector import configureBackends, BACKENDS
+from utils.frame_hub import FrameHub
+from utils.replay_source import openSource, CLOCKS, REALTIME
+from utils.thread_budget import ThreadBudget, configure
+from utils.quality_controller import QualityController
+from utils.gamma import GammaCorrector
+from utils.flow_engine import ENGINES, DEFAULT_ENGINE
+
+DETECTORS = ('knife', 'pistol')
+# Weight of the newest sample in the per-stream fps/latency moving averages
+SMOOTHING = 0.1
+DISPATCH_INTERVAL = 0.05
+STATS_INTERVAL = 5
+
+logger = logging.getLogger("Stream Manager")
+
+ch = logging.StreamHandler()
+ch.setLevel(logging.DEBUG)
+logger.addHandler(ch)
+
+
+class SharedModels:
+    # Exactly one copy of every model per process, created the first time a stream needs it.
+    # tf.Session.run is thread safe, so all streams can call into the same sessions.
+    # With batch_size > 1 the SSD models batch same sized frames from different streams.
+    def __init__ (self, batch_size=1, batch_wait=MAX_WAIT):
+        self.lock = threading.Lock()
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.batchers = []
+        self.cnn = None
+        self.humanDetector = None
+        self.pistolSession = None
+        self.fused = None
+
+    def getCNN(self):
+        with self.lock:
+            if self.cnn is None:
+                self.cnn = loadModels(['knife'])['knife']
+                if self.batch_size > 1:
+                    # Exposes detect(image), so it stands in for the detector itself
+                    self.cnn = InferenceBatcher(self.cnn.detect_batch, self.batch_size, self.batch_wait)
+                    self.batchers.append(self.cnn)
+            return self.cnn
+
+    def getHumanDetector(self):
+        with self.lock:
+            if self.humanDetector is None:
+                self.humanDetector = loadModels(['person'])['person']
+                if self.batch_size > 1:
+                    batcher = InferenceBatcher(self.humanDetector.detector.run_batch, self.batch_size, self.batch_wait)
+                    self.humanDetector.useBatcher(batcher)
+                    self.batchers.append(batcher)
+            return self.humanDetector
+
+    def getFused(self):
+        with self.lock:
+            if self.fused is None:
+                self.fused = loadModels(['fused'])['fused']
+            return self.fused
+
+    def getPistolSession(self):
+        with self.lock:
+            if self.pistolSession is None:
+                self.pistolSession = loadModels(['pistol'])['pistol']
+            return self.pistolSession
+
+
+class Stream:
+    def __init__ (self, streamId, source, detectors, models, clock=REALTIME, fused=False, cascade=False,
+                  keyframes=None, motion_gate=False, target_fps=None, target_latency=None, gamma=None,
+                  flow_engine=DEFAULT_ENGINE, log_level=logging.ERROR):
+        self.streamId = streamId
+        self.flow_engine = flow_engine
+        # One low light correction per stream, so every detector brightens a frame the same way
+        self.gamma = GammaCorrector(gamma)
+        # Trades detection quality for time to hold the target, if there is one
+        self.quality = None
+        if target_fps is not None or target_latency is not None:
+            self.quality = QualityController(target_fps, target_latency, name=str(streamId))
+        self.target_latency = target_latency
+        self.motion_gate = motion_gate
+        # {detector name: run its models every N frames}, missing detectors run on every frame
+        self.keyframes = keyframes or {}
+        self.fused = fused
+        self.cascade = cascade
+        self.source = source
+        self.detectorNames = detectors
+        self.models = models
+        self.log_level = log_level
+        self.hub = FrameHub(lambda: openSource(source, clock=clock))
+        self.subscription = None
+        self.pipeline = None
+        self.busy = False
+
+        self.processed = 0
+        self.fps = 0
+        self.latency = 0
+        self.maxLatency = 0
+        self.processTime = 0
+        self.lastDone = None
+        self.outputs = {}
+
+    def start(self, notify):
+        self.subscription = self.hub.subscribe('stream-%d' % self.streamId, notify)
+
+    def stop(self):
+        if self.subscription is not None:
+            self.subscription.close()
+            self.subscription = None
+
+    def ready(self):
+        return self.subscription is not None and self.subscription.ready()
+
+    def buildPipeline(self, frame):
+        pipeline = []
+        for name in self.detectorNames:
+            if name == 'knife' and self.fused:
+                # Only hand over the shared person detector if the pistol detector will read from it
+                shared = self.models.getHumanDetector() if 'pistol' in self.detectorNames else None
+                detector = OpticalflowDetector(frame, log_level=self.log_level,
+                    fused=self.models.getFused(), humanDetector=shared, keyframe_interval=self.keyframes.get(name, 1),
+                    motion_gate=self.motion_gate, gamma=self.gamma, flow_engine=self.flow_engine)
+            elif name == 'knife':
+                detector = OpticalflowDetector(frame, log_level=self.log_level,
+                    cnn=self.models.getCNN(), humanDetector=self.models.getHumanDetector(), cascade=self.cascade,
+                    keyframe_interval=self.keyframes.get(name, 1), motion_gate=self.motion_gate, gamma=self.gamma,
+                    flow_engine=self.flow_engine)
+            elif name == 'pistol':
+                detector = PistolDetector(log_level=self.log_level,
+                    sess=self.models.getPistolSession(), humanDetector=self.models.getHumanDetector(),
+                    keyframe_interval=self.keyframes.get(name, 1), motion_gate=self.motion_gate, gamma=self.gamma)
+            pipeline.append((name, detector))
+        return pipeline
+
+    def step(self):
+        captured = self.subscription.read(timeout=0)
+        if captured is None:
+            return
+        start = time.time()
+
+        if self.pipeline is None:
+            self.pipeline = self.buildPipeline(captured.image)
+
+        for name, detector in self.pipeline:
+            # Frame keys include the stream, every stream numbers its frames from zero
+            debugImage = detector.detect(captured.image, key=(self.streamId, captured.seq))
+            self.outputs[name] = (captured.seq, debugImage, len(detector.getVotes()))
+
+        done = time.time()
+        latency = done - captured.timestamp
+        self.processed += 1
+        self.processTime = self.processTime + SMOOTHING*((done - start) - self.processTime)
+        self.latency = self.latency + SMOOTHING*(latency - self.latency)
+        self.maxLatency = max(self.maxLatency, latency)
+        if self.lastDone is not None and done > self.lastDone:
+            self.fps = self.fps + SMOOTHING*(1.0/(done - self.lastDone) - self.fps)
+        self.lastDone = done
+
+        if self.quality is not None:
+            # A latency target is judged end to end, a frame rate target on processing time
+            quality = self.quality.update(latency if self.target_latency is not None else done - start)
+            if quality is not None:
+                for name, detector in self.pipeline:
+                    detector.setQuality(quality)
+
+    def getStats(self):
+        dropped = self.subscription.dropped if self.subscription is not None else 0
+        return {'stream': self.streamId,
+                'source': self.source,
+                'processed': self.processed,
+                'dropped': dropped,
+                'fps': self.fps,
+                'latency': self.latency,
+                'max_latency': self.maxLatency,
+                'process_time': self.processTime,
+                'votes': dict((name, output[2]) for name, output in self.outputs.items()),
+                'vote_windows': dict((name, detector.getVotes().counts()) for name, detector in self.pipeline or []),
+                'keyframes': dict((name, detector.getKeyframeStats()) for name, detector in self.pipeline or []),
+                'gate': dict((name, detector.getGateStats()) for name, detector in self.pipeline or []),
+                'quality': self.quality.getStats() if self.quality is not None else None,
+                'gamma': self.gamma.getStats()}
+
+
+class StreamManager:
+    def __init__ (self, sources, detectors=DETECTORS, workers=None, clock=REALTIME,
+                  batch_size=1, batch_wait=MAX_WAIT, fused=False, cascade=False, keyframes=None,
+                  motion_gate=False, budget=None, target_fps=None, target_latency=None, gamma=None,
+                  flow_engine=DEFAULT_ENGINE, log_level=logging.ERROR):
+        for name in detectors:
+            if name not in DETECTORS:
+                raise ValueError('Unknown detector: %s' % name)
+
+        self.detectors = detectors
+        if fused and cascade:
+            raise ValueError('Fused and cascade modes cannot be combined')
+        self.fused = fused
+        self.budget = budget
+        self.models = SharedModels(batch_size, batch_wait)
+        self.streams = [Stream(i, source, detectors, self.models, clock, fused, cascade, keyframes, motion_gate,
+                               target_fps, target_latency, gamma, flow_engine, log_level)
+                        for i, source in enumerate(sources)]
+        # TensorFlow and OpenCV release the GIL, so a thread per core keeps every core busy
+        self.workers = workers if workers else os.cpu_count()
+        self.executor = None
+        self.wakeup = threading.Event()
+        self.running = False
+        self.dispatcher = None
+
+    def start(self):
+        if self.budget is not None:
+            # Must happen before the sessions are created
+            configure(self.budget)
+
+        # Load every model the pipelines need in parallel before the first frame arrives
+        needed = list(self.detectors)
+        if self.fused and 'knife' in needed:
+            needed[needed.index('knife')] = 'fused'
+        if not self.fused or 'pistol' in needed:
+            needed.append('person')
+        loadModels(needed)
+
+        self.running = True
+        self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        for stream in self.streams:
+            stream.start(self.wakeup.set)
+        self.dispatcher = threading.Thread(target=self.dispatch, name='StreamManager')
+        self.dispatcher.daemon = True
+        self.dispatcher.start()
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
+        self.dispatcher.join()
+        self.executor.shutdown(wait=True)
+        for stream in self.streams:
+            stream.stop()
+        for batcher in self.models.batchers:
+            batcher.stop()
+
+    def dispatch(self):
+        # A stream is only ever handed to one worker at a time, so every detector
+        # still sees its frames in order while different streams run in parallel
+        while self.running:
+            self.wakeup.wait(DISPATCH_INTERVAL)
+            self.wakeup.clear()
+            for stream in self.streams:
+                if stream.busy or not stream.ready():
+                    continue
+                stream.busy = True
+                future = self.executor.submit(stream.step)
+                future.add_done_callback(lambda f, stream=stream: self.stepDone(stream, f))
+
+    def stepDone(self, stream, future):
+        stream.busy = False
+        if future.exception() is not None:
+            logger.error('Stream %d failed: %s' % (stream.streamId, future.exception()))
+        self.wakeup.set()
+
+    def getStats(self):
+        return [stream.getStats() for stream in self.streams]
+
+
+# main
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the detectors on several cameras at once')
+    parser.add_argument('sources', nargs='+', help='camera indexes, video files or directories of frames')
+    parser.add_argument('--detectors', nargs='+', default=list(DETECTORS), choices=DETECTORS)
+    parser.add_argument('--clock', default=REALTIME, choices=CLOCKS, help='replay pace for recorded sources')
+    parser.add_argument('--batch-size', type=int, default=1, help='frames from different streams per model run')
+    parser.add_argument('--batch-wait', type=float, default=MAX_WAIT, help='seconds a frame may wait for a batch to fill')
+    parser.add_argument('--fused', action='store_true', help='run person and knife models in one session')
+    parser.add_argument('--cascade', action='store_true', help='only look for knives on detected people')
+    parser.add_argument('--workers', type=int, default=None, help='worker threads, defaults to the number of cores')
+    parser.add_argument('--knife-keyframes', type=int, default=1, help='run the knife pipeline models every N frames')
+    parser.add_argument('--pistol-keyframes', type=int, default=1, help='run the pistol pipeline models every N frames')
+    parser.add_argument('--motion-gate', action='store_true', help='skip the models while a scene does not change')
+    parser.add_argument('--intra-op', type=int, default=None, help='threads inside one TensorFlow op, per session')
+    parser.add_argument('--inter-op', type=int, default=None, help='TensorFlow ops run in parallel, per session')
+    parser.add_argument('--opencv-threads', type=int, default=-1, help='OpenCV worker threads, 0 for none')
+    parser.add_argument('--backend', nargs='+', default=[], metavar='MODEL=BACKEND',
+                        help='inference engine per model, e.g. person=tflite knife=opencv (%s)' % ', '.join(BACKENDS))
+    parser.add_argument('--target-fps', type=float, default=None, help='lower detection quality to hold this frame rate')
+    parser.add_argument('--target-latency', type=float, default=None, help='lower detection quality to hold this latency (s)')
+    parser.add_argument('--gamma', type=float, default=None, help='fixed gamma correction, estimated per frame by default')
+    parser.add_argument('--flow', default=DEFAULT_ENGINE, choices=sorted(ENGINES), help='optical flow engine for knives')
+    args = parser.parse_args()
+
+    configureBackends(args.backend)
+
+    budget = None
+    if args.intra_op is not None or args.inter_op is not None or args.opencv_threads >= 0:
+        budget = ThreadBudget(args.intra_op or 0, args.inter_op or 0, args.opencv_threads)
+
+    manager = StreamManager(args.sources, args.detectors, args.workers, args.clock,
+                            args.batch_size, args.batch_wait, args.fused, args.cascade,
+                            {'knife': args.knife_keyframes, 'pistol': args.pistol_keyframes}, args.motion_gate, budget,
+                            args.target_fps, args.target_latency, args.gamma, args.flow)
+    manager.start()
+    try:
+        while True:
+            time.sleep(STATS_INTERVAL)
+            for stats in manager.getStats():
+                print('stream %(stream)d (%(source)s): %(fps).1f fps, latency %(latency).3fs '
+                      '(max %(max_latency).3fs), processed %(processed)d, dropped %(dropped)d' % stats)
+    except KeyboardInterrupt:
+        manager.stop()
+        sys.exit(0)
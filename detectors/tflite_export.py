@@ -0,0 +1,131 @@
+import sys
+import logging
+import argparse
+
+import cv2
+import numpy as np
+import tensorflow as tf
+
+from objects import cnnDetector
+from objects import humanDetector
+from objects.frozenGraph import readGraphDef, importGraph
+from objects.tfliteDetector import TFLiteSSD, anchorsPath, normalise
+from object_detection.anchor_generators.multiple_grid_anchor_generator import create_ssd_anchors
+from utils.replay_source import openSource, FAST
+from utils.gamma import GammaCorrector
+
+# The SSDs are cut between their preprocessing and postprocessing: TFLite gets the
+# normalised image at Preprocessor/sub and returns the raw box encodings (concat) and
+# class logits (concat_1); TFLiteSSD decodes and suppresses those itself.
+INPUT_NAME = 'Preprocessor/sub'
+OUTPUT_NAMES = ['concat', 'concat_1']
+# ssd_anchor_generator settings shared by both models' pipeline.config
+NUM_LAYERS = 6
+MIN_SCALE = 0.2
+MAX_SCALE = 0.95
+ASPECT_RATIOS = (1.0, 2.0, 0.5, 3.0, 0.3333)
+# The detectors feed the models frames scaled like this, and brightened by utils/gamma.py
+SCALE = 0.3
+CALIBRATION_FRAMES = 200
+
+# graph: frozen graph, size: fixed_shape_resizer, rgb: whether the detector converts frames to RGB
+MODELS = {
+    'person': {'graph': humanDetector.model_path, 'tflite': humanDetector.tflite_model_path, 'size': 300, 'rgb': False},
+    'knife': {'graph': cnnDetector.PATH_TO_CKPT, 'tflite': cnnDetector.PATH_TO_TFLITE, 'size': 400, 'rgb': True},
+}
+
+logger = logging.getLogger("TFLite Export")
+
+ch = logging.StreamHandler()
+ch.setLevel(logging.DEBUG)
+logger.addHandler(ch)
+
+
+def featureMapShapes(graph, size):
+    # The anchors are not part of the cut graph; their grid sizes come from the box predictors
+    with tf.Session(graph=graph) as sess:
+        tensors = []
+        layer = 0
+        while True:
+            try:
+                tensors.append(graph.get_tensor_by_name('BoxPredictor_%d/BoxEncodingPredictor/BiasAdd:0' % layer))
+            except KeyError:
+                break
+            layer += 1
+        maps = sess.run(tensors, {'image_tensor:0': np.zeros((1, size, size, 3), dtype=np.uint8)})
+    return [tuple(m.shape[1:3]) for m in maps]
+
+
+def generateAnchors(shapes):
+    generator = create_ssd_anchors(NUM_LAYERS, MIN_SCALE, MAX_SCALE, ASPECT_RATIOS)
+    with tf.Graph().as_default():
+        anchors = generator.generate(shapes)
+        with tf.Session() as sess:
+            return sess.run(anchors.get())
+
+
+def calibrationFrames(source, count, size, rgb):
+    # Frames as the detectors see them, for the int8 ranges to match what they will be fed
+    gamma = GammaCorrector()
+    cap = openSource(source, clock=FAST)
+    frames = []
+    while len(frames) < count:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frame = gamma.correct(cv2.resize(frame, None, fx=SCALE, fy=SCALE))
+        if rgb:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        frames.append(normalise(frame, size, size))
+    if len(frames) == 0:
+        raise ValueError('No calibration frames in %s' % source)
+    logger.info('Calibrating on %d frames' % len(frames))
+    return frames
+
+
+def exportTFLite(name, source, count=CALIBRATION_FRAMES, dst=None):
+    model = MODELS[name]
+    dst = dst or model['tflite']
+    graph_def = readGraphDef(model['graph'])
+
+    anchors = generateAnchors(featureMapShapes(importGraph(graph_def), model['size']))
+    frames = calibrationFrames(source, count, model['size'], model['rgb'])
+
+    def representativeDataset():
+        for frame in frames:
+            yield [np.expand_dims(frame, axis=0)]
+
+    converter = tf.lite.TFLiteConverter.from_frozen_graph(model['graph'], [INPUT_NAME], OUTPUT_NAMES,
+        input_shapes={INPUT_NAME: [1, model['size'], model['size'], 3]})
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = representativeDataset
+    # Integer kernels only, so nothing falls back to float on the edge boxes
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    converter.inference_input_type = tf.uint8
+    tflite_model = converter.convert()
+
+    with open(dst, 'wb') as f:
+        f.write(tflite_model)
+    np.save(anchorsPath(dst), anchors)
+
+    # Check the anchors line up with what the model predicts before anyone uses it
+    ssd = TFLiteSSD(dst)
+    predicted = np.prod(ssd.boxOutput['shape'])//4
+    if predicted != anchors.shape[0]:
+        raise ValueError('%s predicts %d boxes but has %d anchors' % (dst, predicted, anchors.shape[0]))
+    logger.info('Wrote %s (%d bytes) with %d anchors' % (dst, len(tflite_model), anchors.shape[0]))
+    return dst
+
+
+# main
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export int8 TFLite versions of the SSD detectors')
+    parser.add_argument('source', help='video file or directory of frames to calibrate the quantisation on')
+    parser.add_argument('--models', nargs='+', default=sorted(MODELS), choices=sorted(MODELS))
+    parser.add_argument('--frames', type=int, default=CALIBRATION_FRAMES, help='calibration frames per model')
+    args = parser.parse_args()
+
+    logger.setLevel(logging.INFO)
+    for name in args.models:
+        exportTFLite(name, args.source, args.frames)
+    sys.exit(0)
@@ -1,18 +1,19 @@
 import tensorflow as tf
-import object_detection
-from object_detection.utils import label_map_util
-from object_detection.utils import visualization_utils as vis_util
 
 import cv2
 import numpy as np
 import os
 import sys
+import threading
+from collections import namedtuple
 
 
 # Object detection module imports
 import object_detection
 from object_detection.utils import label_map_util
-from object_detection.utils import visualization_utils as vis_util
+
+from objects.frozenGraph import readGraphDef, importGraph
+from objects.objectDetector import ObjectDetector, createBackend, backendFor
 
 # SET FRACTION OF GPU YOU WANT TO USE HERE
 GPU_FRACTION = 0.4
@@ -21,65 +22,112 @@ GPU_FRACTION = 0.4
 MODEL_PATH = './data/models/knife_ssd'
 # Path to frozen detection graph. This is the actual model that is used for the object detection.
 PATH_TO_CKPT = MODEL_PATH + '/frozen_inference_graph.pb'
+# int8 TFLite export of the same model, written by detectors/tflite_export.py
+PATH_TO_TFLITE = MODEL_PATH + '/model_int8.tflite'
+# Generated with OpenCV's tf_text_graph_ssd.py, see objects/objectDetector.py
+PATH_TO_OPENCV_CONFIG = MODEL_PATH + '/opencv_graph.pbtxt'
+MODEL_FILES = {'tf': PATH_TO_CKPT,
+               'opencv': (PATH_TO_CKPT, PATH_TO_OPENCV_CONFIG, 400),
+               'tflite': PATH_TO_TFLITE}
 ######### Set the label map file here ###########
 PATH_TO_LABELS = './data/labels/knife_label.pbtxt'
 ######### Set the number of classes here #########
 NUM_CLASSES = 1
+# Same cut-offs visualize_boxes_and_labels_on_image_array used to apply
+MIN_SCORE_THRESH = .5
+MAX_DETECTIONS = 20
 
-detection_graph = tf.Graph()
-with detection_graph.as_default():
-    od_graph_def = tf.GraphDef()
-    with tf.gfile.GFile(PATH_TO_CKPT, 'rb') as fid:
-        serialized_graph = fid.read()
-        od_graph_def.ParseFromString(serialized_graph)
-        tf.import_graph_def(od_graph_def, name='')
-
-## Loading label map
-# Label maps map indices to category names, so that when our convolution network predicts `5`,
-# we know that this corresponds to `airplane`.  Here we use internal utility functions,
-# but anything that returns a dictionary mapping integers to appropriate string labels would be fine
-label_map = label_map_util.load_labelmap(PATH_TO_LABELS)
-categories = label_map_util.convert_label_map_to_categories(label_map, max_num_classes=NUM_CLASSES, use_display_name=True)
-category_index = label_map_util.create_category_index(categories)
+# Indexable like the old [class_id, score, box] lists; box is normalised (ymin, xmin, ymax, xmax)
+Detection = namedtuple('Detection', ['class_id', 'score', 'box'])
+
+# The graph and label map are loaded on first use (see loadGraph) rather than at import time
+detection_graph = None
+category_index = None
+graph_lock = threading.Lock()
 
 # Setting the GPU options to use fraction of gpu that has been set
 config = tf.ConfigProto()
 config.gpu_options.per_process_gpu_memory_fraction = GPU_FRACTION
 
 
-class CNNDetector:
-    def __init__ (self):
-        self.sess = tf.Session(graph=detection_graph, config=config)
-
-    def detect (self, image):
-        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-
-        # the array based representation of the image will be used later in order to prepare the
-        # result image with boxes and labels on it.
-        image_np = np.asarray(image)
-        # Expand dimensions since the model expects images to have shape: [1, None, None, 3]
-        image_np_expanded = np.expand_dims(image_np, axis=0)
-        image_tensor = detection_graph.get_tensor_by_name('image_tensor:0')
-        # Each box represents a part of the image where a particular object was detected.
-        boxes = detection_graph.get_tensor_by_name('detection_boxes:0')
-        # Each score represent how level of confidence for each of the objects.
-        # Score is shown on the result image, together with the class label.
-        scores = detection_graph.get_tensor_by_name('detection_scores:0')
-        classes = detection_graph.get_tensor_by_name('detection_classes:0')
-        num_detections = detection_graph.get_tensor_by_name('num_detections:0')
-
-        (boxes, scores, classes, num_detections) = self.sess.run([boxes, scores, classes, num_detections],
-            feed_dict={image_tensor: image_np_expanded})
-
-        objects=vis_util.visualize_boxes_and_labels_on_image_array(
-            image,
-            np.squeeze(boxes),
-            np.squeeze(classes).astype(np.int32),
-            np.squeeze(scores),
-            category_index,
-            use_normalized_coordinates=True,
-            line_thickness=1)
-
-        image = cv2.cvtColor(image_np, cv2.COLOR_BGR2RGB)
-        
-        return objects
+def loadCategoryIndex():
+    ## Loading label map
+    # Label maps map indices to category names, so that when our convolution network predicts `5`,
+    # we know that this corresponds to `airplane`.  Here we use internal utility functions,
+    # but anything that returns a dictionary mapping integers to appropriate string labels would be fine
+    label_map = label_map_util.load_labelmap(PATH_TO_LABELS)
+    categories = label_map_util.convert_label_map_to_categories(label_map, max_num_classes=NUM_CLASSES, use_display_name=True)
+    return label_map_util.create_category_index(categories)
+
+
+def loadGraph(graph_def=None):
+    # graph_def can be handed in already parsed, e.g. by detectors/model_loader.py
+    global detection_graph, category_index
+    with graph_lock:
+        if detection_graph is not None:
+            return detection_graph
+        if graph_def is None:
+            graph_def = readGraphDef(PATH_TO_CKPT)
+        graph = importGraph(graph_def)
+
+        category_index = loadCategoryIndex()
+        detection_graph = graph
+        return detection_graph
+
+
+def extractDetections(boxes, scores, classes, class_ids, min_score_thresh=MIN_SCORE_THRESH):
+    # Detections come sorted by score, so the cut-offs are a slice and a mask
+    boxes = boxes[:MAX_DETECTIONS]
+    scores = scores[:MAX_DETECTIONS]
+    classes = classes[:MAX_DETECTIONS].astype(np.int32)
+
+    keep = (scores > min_score_thresh) & np.isin(classes, class_ids)
+    return [Detection(class_id, score, tuple(box))
+            for class_id, score, box in zip(classes[keep].tolist(), scores[keep].tolist(), boxes[keep].tolist())]
+
+
+class CNNDetector (ObjectDetector):
+    def __init__ (self, graph_def=None, min_score_thresh=MIN_SCORE_THRESH, tflite_path=None, backend=None):
+        # backend: 'tf', 'opencv' or 'tflite', defaults to the one configured for 'knife'
+        global category_index
+        if backend is None:
+            backend = 'tflite' if tflite_path is not None else backendFor('knife')
+        if backend == 'tf':
+            # Every TensorFlow CNNDetector shares the one imported graph
+            model = createBackend(backend, MODEL_FILES, 'knife', graph=loadGraph(graph_def), config=config)
+        else:
+            with graph_lock:
+                if category_index is None:
+                    category_index = loadCategoryIndex()
+            model = createBackend(backend, dict(MODEL_FILES, tflite=tflite_path or PATH_TO_TFLITE), 'knife')
+        ObjectDetector.__init__(self, model, category_index, min_score_thresh)
+        self.class_ids = np.array(sorted(category_index.keys()))
+
+    def detect_batch (self, images):
+        # Same sized frames (e.g. from several streams) go through the model in one run.
+        # Pure analysis: nothing is drawn, use draw() for that.
+        shapes = set(image.shape for image in images)
+        if len(shapes) != 1:
+            raise ValueError('Batched images must all have the same shape, got %s' % sorted(shapes))
+
+        # The model takes RGB images with shape [batch, None, None, 3]; convert straight into the batch
+        image_np_batch = np.empty((len(images),) + images[0].shape, dtype=np.uint8)
+        for i, image in enumerate(images):
+            cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=image_np_batch[i])
+
+        return ObjectDetector.detect_batch(self, image_np_batch)
+
+    def extract (self, image, output_dict):
+        return extractDetections(output_dict['detection_boxes'][0], output_dict['detection_scores'][0],
+                                 output_dict['detection_classes'][0], self.class_ids, self.min_score_thresh)
+
+    def draw (self, image, detections, color=(0, 0, 255)):
+        # Opt-in: draws the detections onto a BGR image in place
+        height, width = image.shape[:2]
+        for detection in detections:
+            ymin, xmin, ymax, xmax = detection.box
+            top_left = (int(xmin*width), int(ymin*height))
+            cv2.rectangle(image, top_left, (int(xmax*width), int(ymax*height)), color, 1)
+            label = '{}: {}%'.format(category_index[detection.class_id]['name'], int(100*detection.score))
+            cv2.putText(image, label, (top_left[0], max(top_left[1] - 2, 10)), cv2.FONT_HERSHEY_SIMPLEX, 0.4, color, 1)
+        return image
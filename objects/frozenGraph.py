@@ -0,0 +1,17 @@
+import tensorflow as tf
+
+
+def readGraphDef(path):
+    # Parsing the serialized protobuf is the slow part of loading a frozen model
+    graph_def = tf.GraphDef()
+    with tf.gfile.GFile(path, 'rb') as fid:
+        serialized_graph = fid.read()
+        graph_def.ParseFromString(serialized_graph)
+    return graph_def
+
+
+def importGraph(graph_def):
+    graph = tf.Graph()
+    with graph.as_default():
+        tf.import_graph_def(graph_def, name='')
+    return graph
@@ -0,0 +1,62 @@
+import tensorflow as tf
+
+import cv2
+import numpy as np
+
+from objects import cnnDetector
+from objects import humanDetector
+from objects.frozenGraph import readGraphDef
+from objects.cnnDetector import extractDetections, MIN_SCORE_THRESH
+from objects.humanDetector import extractPeople
+from utils.thread_budget import sessionConfig
+
+OUTPUTS = ('detection_boxes', 'detection_scores', 'detection_classes', 'num_detections')
+
+
+class FusedDetector:
+    # The person SSDLite and the knife SSD imported side by side into one graph under the
+    # 'person/' and 'knife/' name scopes. Both are fetched in a single sess.run, which lets
+    # TensorFlow overlap the two models on its inter-op thread pool and saves a session
+    # round trip per frame.
+    def __init__ (self, person_graph_def=None, knife_graph_def=None, min_score_thresh=MIN_SCORE_THRESH):
+        if person_graph_def is None:
+            person_graph_def = readGraphDef(humanDetector.model_path)
+        if knife_graph_def is None:
+            knife_graph_def = readGraphDef(cnnDetector.PATH_TO_CKPT)
+
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            tf.import_graph_def(person_graph_def, name='person')
+            tf.import_graph_def(knife_graph_def, name='knife')
+        self.sess = tf.Session(graph=self.graph, config=sessionConfig('fused', cnnDetector.config))
+
+        self.min_score_thresh = min_score_thresh
+        self.person_category_index = humanDetector.loadCategoryIndex()
+        self.knife_class_ids = np.array(sorted(cnnDetector.loadCategoryIndex().keys()))
+
+        self.person_image = self.graph.get_tensor_by_name('person/image_tensor:0')
+        self.knife_image = self.graph.get_tensor_by_name('knife/image_tensor:0')
+        self.fetches = {}
+        for scope in ('person', 'knife'):
+            self.fetches[scope] = dict((name, self.graph.get_tensor_by_name('%s/%s:0' % (scope, name)))
+                                       for name in OUTPUTS)
+
+    def run(self, image):
+        # Each model keeps its own input convention: the person model is fed the BGR
+        # frame as HumanDetector does, the knife model RGB as CNNDetector does
+        knife_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        return self.sess.run(self.fetches, feed_dict={self.person_image: np.expand_dims(image, axis=0),
+                                                      self.knife_image: np.expand_dims(knife_image, axis=0)})
+
+    def detect(self, image, human_thresh, shared=None, key=None):
+        # Returns (person boxes, knife Detections). With a SharedHumanDetector and a frame key
+        # the person result is published so other detectors do not run the person model again.
+        outputs = self.run(image)
+        if shared is not None and key is not None:
+            shared.publish(key, outputs['person'])
+
+        humans = extractPeople(outputs['person'], self.person_category_index, human_thresh)
+        knife = outputs['knife']
+        knives = extractDetections(knife['detection_boxes'][0], knife['detection_scores'][0],
+                                   knife['detection_classes'][0], self.knife_class_ids, self.min_score_thresh)
+        return humans, knives
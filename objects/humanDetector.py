@@ -6,91 +6,177 @@ import cv2
 import numpy as np
 import os
 import sys
+import threading
+from collections import OrderedDict
+
+from objects.objectDetector import ObjectDetector, createBackend, backendFor
 
 model_path = "./data/models/ssdlite_mobilenet_v2_coco_2018_05_09/frozen_inference_graph.pb"
+# Written by detectors/tflite_export.py
+tflite_model_path = "./data/models/ssdlite_mobilenet_v2_coco_2018_05_09/model_int8.tflite"
+# Generated with OpenCV's tf_text_graph_ssd.py, see objects/objectDetector.py
+opencv_config_path = "./data/models/ssdlite_mobilenet_v2_coco_2018_05_09/opencv_graph.pbtxt"
+MODEL_FILES = {'tf': model_path,
+               'opencv': (model_path, opencv_config_path, 300),
+               'tflite': tflite_model_path}
 
 NUM_CLASSES = 90
+# Number of recent frames whose raw detections the shared detector keeps around
+CACHE_SIZE = 8
 # label_map = label_map_util.load_labelmap('/home/ruth/Documents/Bumblebee/ML/models/label_map.pbtxt')
 label_map = label_map_util.load_labelmap('./data/labels/mscoco_label_map.pbtxt')
 
-class HumanDetector:
-    def __init__ (self, min_score_thresh=.5):
-        self.min_score_thresh = min_score_thresh
-        self.load_model()
-
+class HumanDetector (ObjectDetector):
+    def __init__ (self, min_score_thresh=.5, graph_def=None, tflite_path=None, backend=None):
+        # backend: 'tf', 'opencv' or 'tflite', defaults to the one configured for 'person'.
+        # graph_def can be handed in already parsed, e.g. by detectors/model_loader.py
+        if backend is None:
+            backend = 'tflite' if tflite_path is not None else backendFor('person')
+        files = dict(MODEL_FILES, tflite=tflite_path or tflite_model_path)
+        ObjectDetector.__init__(self, createBackend(backend, files, 'person', graph_def=graph_def,
+                                                    config=tf.ConfigProto(allow_soft_placement=True)),
+                                loadCategoryIndex(), min_score_thresh)
 
-    def load_model(self):
-        self.detection_graph = tf.Graph()
-        with self.detection_graph.as_default():
-            od_graph_def = tf.GraphDef()
-            with tf.gfile.GFile(model_path, 'rb') as fid:
-                serialized_graph = fid.read()
-                od_graph_def.ParseFromString(serialized_graph)
-                tf.import_graph_def(od_graph_def, name='')
+    def detect(self, img, out_img=None):
+        output_dict = self.run(img)
 
-        categories = label_map_util.convert_label_map_to_categories(label_map, max_num_classes=NUM_CLASSES, use_display_name=True)
-        self.category_index = label_map_util.create_category_index(categories)
+        if out_img is None:
+            out_img = img.copy()
 
-        # load session
-        self.sess = tf.Session(graph=self.detection_graph, config=tf.ConfigProto(allow_soft_placement=True))
+        return self.extract(out_img, output_dict)
 
-        with self.detection_graph.as_default():
+    def detect_batch(self, imgs, min_score_thresh=None):
+        # Same sized frames (e.g. from several streams) go through the model in one run
+        return [self.extract(img, output_dict, min_score_thresh)
+                for img, output_dict in zip(imgs, self.run_batch(imgs))]
 
-            self.image_tensor = tf.get_default_graph().get_tensor_by_name('image_tensor:0')
-            # self.image_tensor = self.detection_graph.get_tensor_by_name('image_tensor:0')
-            self.detection_boxes = tf.get_default_graph().get_tensor_by_name('detection_boxes:0')
-            self.detection_scores = tf.get_default_graph().get_tensor_by_name('detection_scores:0')
-            self.detection_classes = tf.get_default_graph().get_tensor_by_name('detection_classes:0')
-            self.num_detections = tf.get_default_graph().get_tensor_by_name('num_detections:0')
+    def extract(self, out_img, output_dict, min_score_thresh=None):
+        if min_score_thresh is None:
+            min_score_thresh = self.min_score_thresh
+        return extractPeople(output_dict, self.category_index, min_score_thresh)
 
 
-    def detect(self, img, out_img=None):
+def loadCategoryIndex():
+    categories = label_map_util.convert_label_map_to_categories(label_map, max_num_classes=NUM_CLASSES, use_display_name=True)
+    return label_map_util.create_category_index(categories)
 
-        image_np_expanded = np.expand_dims(img, axis=0)
 
-        output_dict = self.sess.run({ \
-                            'detection_boxes': self.detection_boxes, \
-                            'detection_scores': self.detection_scores, \
-                            'detection_classes': self.detection_classes, \
-                            'num_detections': self.num_detections},
-                            feed_dict={self.image_tensor: image_np_expanded})
+def extractPeople(output_dict, category_index, min_score_thresh):
+    # Person boxes (normalised ymin, xmin, ymax, xmax) from a single-image output dict
+    boxes = np.squeeze(output_dict['detection_boxes'])
+    classes =  np.squeeze(output_dict['detection_classes']).astype(np.int32)
+    scores = np.squeeze(output_dict['detection_scores'])
 
-        if out_img is None:
-            out_img = img.copy()
+    objs = []
 
-        return self.extract(out_img, output_dict)
+    boxes = boxes[scores > min_score_thresh]
+    classes = classes[scores > min_score_thresh]
+    scores = scores[scores > min_score_thresh]
 
-    def extract(self, out_img, output_dict):
-        height, width, _ = out_img.shape
+    for i in range(boxes.shape[0]):
+        # box = tuple(boxes[i].tolist())
 
-        boxes = np.squeeze(output_dict['detection_boxes'])
-        classes =  np.squeeze(output_dict['detection_classes']).astype(np.int32)
-        scores = np.squeeze(output_dict['detection_scores'])
+        if scores[i] > min_score_thresh:
+            box = tuple(boxes[i].tolist())
+        else:
+            continue
 
-        objs = []
+        display_str = ''
+        if classes[i] in category_index.keys() and str(category_index[classes[i]]['name']) == 'person':
+            pass
+        else:
+            continue
+    
+        # ymin, xmin, ymax, xmax = boxes[i]
+        # (left, right, top, bottom) = (xmin * width, xmax * width, \
+        #                               ymin * height, ymax * height)
 
-        boxes = boxes[scores > self.min_score_thresh]
-        classes = classes[scores > self.min_score_thresh]
-        scores = scores[scores > self.min_score_thresh]
+        objs.append(boxes[i])
 
-        for i in range(boxes.shape[0]):
-            # box = tuple(boxes[i].tolist())
+    return objs
 
-            if scores[i] > self.min_score_thresh:
-                box = tuple(boxes[i].tolist())
-            else:
-                continue
 
-            display_str = ''
-            if classes[i] in self.category_index.keys() and str(self.category_index[classes[i]]['name']) == 'person':
-                pass
-            else:
-                continue
-        
-            # ymin, xmin, ymax, xmax = boxes[i]
-            # (left, right, top, bottom) = (xmin * width, xmax * width, \
-            #                               ymin * height, ymax * height)
+class SharedHumanDetector:
+    # Person detection service shared by every detector in the process. The model is loaded
+    # once, and the raw output for a frame is computed once and handed to every consumer
+    # asking about the same frame key (e.g. the FrameHub sequence number).
+    def __init__ (self, detector, cache_size=CACHE_SIZE):
+        self.detector = detector
+        # Runs the model on one frame, swapped for an InferenceBatcher by useBatcher()
+        self.run = detector.run
+        self.min_score_thresh = detector.min_score_thresh
+        self.cache_size = cache_size
+        self.lock = threading.Lock()
+        self.results = OrderedDict()
 
-            objs.append(boxes[i])
+        self.runs = 0
+        self.hits = 0
 
-        return objs
+    def detect(self, img, out_img=None, key=None, min_score_thresh=None):
+        if out_img is None:
+            out_img = img
+        if key is None:
+            self.runs += 1
+            return self.detector.extract(out_img, self.run(img), min_score_thresh)
+
+        with self.lock:
+            entry = self.results.get(key)
+            owner = entry is None
+            if owner:
+                entry = [threading.Event(), None]
+                self.results[key] = entry
+                while len(self.results) > self.cache_size:
+                    self.results.popitem(last=False)
+            else:
+                self.hits += 1
+
+        if owner:
+            # Whoever asks first runs the model, everyone else waits for the published result
+            try:
+                entry[1] = self.run(img)
+                self.runs += 1
+            except Exception:
+                with self.lock:
+                    self.results.pop(key, None)
+                raise
+            finally:
+                entry[0].set()
+        else:
+            entry[0].wait()
+            if entry[1] is None:
+                raise RuntimeError('Person detection failed for frame %s' % (key,))
+
+        return self.detector.extract(out_img, entry[1], min_score_thresh)
+
+    def publish(self, key, output_dict):
+        # Hand in a result computed elsewhere (e.g. by objects/fusedDetector.py) for a frame key
+        with self.lock:
+            entry = self.results.get(key)
+            if entry is None:
+                entry = [threading.Event(), None]
+                self.results[key] = entry
+                while len(self.results) > self.cache_size:
+                    self.results.popitem(last=False)
+            if entry[1] is None:
+                entry[1] = output_dict
+                entry[0].set()
+
+    def useBatcher(self, batcher):
+        # batcher must wrap self.detector.run_batch
+        self.run = batcher.detect
+
+
+shared_detector = None
+shared_detector_lock = threading.Lock()
+
+def getSharedHumanDetector(min_score_thresh=0.3, graph_def=None):
+    # One person detection model per process, created on first use
+    global shared_detector
+    with shared_detector_lock:
+        if shared_detector is None:
+            shared_detector = SharedHumanDetector(HumanDetector(min_score_thresh, graph_def))
+        return shared_detector
+
+
+def isSharedHumanDetectorLoaded():
+    return shared_detector is not None
@@ -0,0 +1,109 @@
+import time
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+MAX_BATCH_SIZE = 8
+# Longest a frame waits for company before its batch is run anyway, in seconds
+MAX_WAIT = 0.01
+
+
+class InferenceBatcher:
+    # Collects single-frame requests from many streams and runs them through a
+    # detect_batch-style function (list of images -> list of results) in batches.
+    # Frames are grouped by shape, since only same sized frames can be stacked.
+    def __init__ (self, batch_fn, max_batch_size=MAX_BATCH_SIZE, max_wait=MAX_WAIT):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.requests = queue.Queue()
+        self.running = True
+        # Orders submit() against stop(), nothing is queued behind the stop sentinel
+        self.lock = threading.Lock()
+
+        self.batches = 0
+        self.frames = 0
+
+        self.thread = threading.Thread(target=self.run, name='InferenceBatcher')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, image):
+        future = Future()
+        with self.lock:
+            if not self.running:
+                raise RuntimeError('InferenceBatcher is stopped')
+            self.requests.put((image, future))
+        return future
+
+    def detect(self, image):
+        return self.submit(image).result()
+
+    def detect_batch(self, images):
+        futures = [self.submit(image) for image in images]
+        return [future.result() for future in futures]
+
+    def stop(self):
+        with self.lock:
+            self.running = False
+            self.requests.put(None)
+        self.thread.join()
+        self.drain()
+
+    def drain(self):
+        # Requests the thread did not get to before stopping fail instead of hanging
+        while True:
+            try:
+                request = self.requests.get_nowait()
+            except queue.Empty:
+                return
+            if request is not None:
+                request[1].set_exception(RuntimeError('InferenceBatcher stopped before running the request'))
+
+    def run(self):
+        while self.running:
+            request = self.requests.get()
+            if request is None:
+                break
+
+            # Keep gathering until the batch is full or the oldest frame has waited long enough
+            pending = [request]
+            deadline = time.time() + self.max_wait
+            while len(pending) < self.max_batch_size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self.requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if request is None:
+                    self.running = False
+                    break
+                pending.append(request)
+
+            groups = OrderedDict()
+            for image, future in pending:
+                groups.setdefault(image.shape, []).append((image, future))
+
+            for group in groups.values():
+                self.runBatch(group)
+
+    def runBatch(self, group):
+        try:
+            results = self.batch_fn([image for image, future in group])
+        except Exception as e:
+            for image, future in group:
+                future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.frames += len(group)
+        for (image, future), result in zip(group, results):
+            future.set_result(result)
+
+    def getStats(self):
+        return {'batches': self.batches,
+                'frames': self.frames,
+                'mean_batch_size': self.frames/float(self.batches) if self.batches else 0}
@@ -1,5 +1,3 @@
-from objectDetector import ObjectDetector
-import tensorflow as tf
 import object_detection
 from object_detection.utils import label_map_util
 
@@ -8,6 +6,9 @@ import numpy as np
 import os
 import sys
 
+from objects import cnnDetector
+from objects.objectDetector import ObjectDetector, createBackend, backendFor
+
 model_path = "./data/models/knife_ssd/frozen_inference_graph.pb"
 
 NUM_CLASSES = 1
@@ -15,46 +16,17 @@ NUM_CLASSES = 1
 label_map = label_map_util.load_labelmap('./data/labels/knife_label.pbtxt')
 
 class KnifeDetector (ObjectDetector):
-    def __init__ (self, min_score_thresh=.5):
-        self.min_score_thresh = min_score_thresh
-        self.load_model()
-
-
-    def load_model(self):
-        self.detection_graph = tf.Graph()
-        with self.detection_graph.as_default():
-            od_graph_def = tf.GraphDef()
-            with tf.gfile.GFile(model_path, 'rb') as fid:
-                serialized_graph = fid.read()
-                od_graph_def.ParseFromString(serialized_graph)
-                tf.import_graph_def(od_graph_def, name='')
-
+    # Knife SSD on the BGR frame as given, returning [score, box] pairs.
+    # The detectors use objects/cnnDetector.py, which feeds the model RGB.
+    def __init__ (self, min_score_thresh=.5, backend=None):
         categories = label_map_util.convert_label_map_to_categories(label_map, max_num_classes=NUM_CLASSES, use_display_name=True)
-        self.category_index = label_map_util.create_category_index(categories)
-
-        # load session
-        self.sess = tf.Session(graph=self.detection_graph, config=tf.ConfigProto(allow_soft_placement=True))
-
-        with self.detection_graph.as_default():
-
-            self.image_tensor = tf.get_default_graph().get_tensor_by_name('image_tensor:0')
-            # self.image_tensor = self.detection_graph.get_tensor_by_name('image_tensor:0')
-            self.detection_boxes = tf.get_default_graph().get_tensor_by_name('detection_boxes:0')
-            self.detection_scores = tf.get_default_graph().get_tensor_by_name('detection_scores:0')
-            self.detection_classes = tf.get_default_graph().get_tensor_by_name('detection_classes:0')
-            self.num_detections = tf.get_default_graph().get_tensor_by_name('num_detections:0')
+        files = dict(cnnDetector.MODEL_FILES, tf=model_path)
+        ObjectDetector.__init__(self, createBackend(backend or backendFor('knife'), files, 'knife'),
+                                label_map_util.create_category_index(categories), min_score_thresh)
 
 
     def detect(self, img, out_img=None):
-
-        image_np_expanded = np.expand_dims(img, axis=0)
-
-        output_dict = self.sess.run({ \
-                            'detection_boxes': self.detection_boxes, \
-                            'detection_scores': self.detection_scores, \
-                            'detection_classes': self.detection_classes, \
-                            'num_detections': self.num_detections},
-                            feed_dict={self.image_tensor: image_np_expanded})
+        output_dict = self.run(img)
 
         if out_img is None:
             out_img = img.copy()
@@ -0,0 +1,148 @@
+import threading
+
+import cv2
+import numpy as np
+
+from objects.frozenGraph import readGraphDef, importGraph
+from utils.thread_budget import sessionConfig
+
+# What every backend returns for a batch of N images, like a frozen SSD graph's sess.run:
+# detection_boxes [N, K, 4] normalised (ymin, xmin, ymax, xmax), detection_scores [N, K],
+# detection_classes [N, K] (label map ids, from 1) and num_detections [N]
+OUTPUTS = ('detection_boxes', 'detection_scores', 'detection_classes', 'num_detections')
+BACKENDS = ('tf', 'opencv', 'tflite')
+DEFAULT_BACKEND = 'tf'
+MAX_DETECTIONS = 100
+
+# {model name: backend}, models not listed run on DEFAULT_BACKEND
+backends = {}
+
+
+def configureBackends(choices):
+    # choices: {model name: backend} or a list of 'model=backend' strings (command line)
+    if not isinstance(choices, dict):
+        choices = dict(choice.split('=', 1) for choice in choices)
+    for name, backend in choices.items():
+        if backend not in BACKENDS:
+            raise ValueError('Unknown backend for %s: %s' % (name, backend))
+    backends.update(choices)
+    return backends
+
+
+def backendFor(name):
+    return backends.get(name, DEFAULT_BACKEND)
+
+
+def stackImages(images):
+    if isinstance(images, np.ndarray):
+        return images
+    shapes = set(image.shape for image in images)
+    if len(shapes) != 1:
+        raise ValueError('Batched images must all have the same shape, got %s' % sorted(shapes))
+    return np.stack(images)
+
+
+class TFSessionBackend:
+    # The frozen graph in a tf.Session, fed at image_tensor
+    def __init__ (self, graph=None, graph_def=None, graph_path=None, name=None, config=None):
+        import tensorflow as tf
+
+        if graph is None:
+            graph = importGraph(graph_def if graph_def is not None else readGraphDef(graph_path))
+        self.graph = graph
+        self.sess = tf.Session(graph=graph, config=sessionConfig(name, config))
+        # Looked up once instead of on every frame
+        self.image_tensor = graph.get_tensor_by_name('image_tensor:0')
+        self.fetches = dict((output, graph.get_tensor_by_name(output + ':0')) for output in OUTPUTS)
+
+    def detect(self, images):
+        return self.sess.run(self.fetches, feed_dict={self.image_tensor: stackImages(images)})
+
+
+class OpenCVBackend:
+    # The same frozen graph on OpenCV's dnn module. OpenCV needs a text description of the
+    # SSD next to it, generated once with OpenCV's samples/dnn/tf_text_graph_ssd.py:
+    #   python tf_text_graph_ssd.py --input frozen_inference_graph.pb --config pipeline.config
+    #       --output opencv_graph.pbtxt
+    def __init__ (self, graph_path, config_path, size):
+        self.net = cv2.dnn.readNetFromTensorflow(graph_path, config_path)
+        self.size = size
+        # A cv2.dnn.Net holds its blobs between forward() calls
+        self.lock = threading.Lock()
+
+    def detect(self, images):
+        images = list(images)
+        # Colour order is left to the caller, as with image_tensor
+        blob = cv2.dnn.blobFromImages(images, 1.0, (self.size, self.size), swapRB=False, crop=False)
+        with self.lock:
+            self.net.setInput(blob)
+            # [1, 1, detections, 7]: image id, class id, score, xmin, ymin, xmax, ymax
+            rows = self.net.forward().reshape(-1, 7)
+
+        output = emptyOutput(len(images))
+        for i in range(len(images)):
+            mine = rows[rows[:, 0] == i]
+            mine = mine[np.argsort(-mine[:, 2])][:MAX_DETECTIONS]
+            count = len(mine)
+            output['detection_boxes'][i, :count] = np.clip(mine[:, [4, 3, 6, 5]], 0.0, 1.0)
+            output['detection_scores'][i, :count] = mine[:, 2]
+            output['detection_classes'][i, :count] = mine[:, 1]
+            output['num_detections'][i] = count
+        return output
+
+
+class TFLiteBackend:
+    # int8 model from detectors/tflite_export.py
+    def __init__ (self, model_path):
+        from objects.tfliteDetector import TFLiteSSD
+
+        self.ssd = TFLiteSSD(model_path)
+
+    def detect(self, images):
+        outputs = self.ssd.run_batch(list(images))
+        return dict((name, np.concatenate([output[name] for output in outputs])) for name in OUTPUTS)
+
+
+def emptyOutput(count):
+    return {'detection_boxes': np.zeros((count, MAX_DETECTIONS, 4), dtype=np.float32),
+            'detection_scores': np.zeros((count, MAX_DETECTIONS), dtype=np.float32),
+            'detection_classes': np.zeros((count, MAX_DETECTIONS), dtype=np.float32),
+            'num_detections': np.zeros((count,), dtype=np.float32)}
+
+
+def createBackend(backend, files, name=None, graph=None, graph_def=None, config=None):
+    # files: {'tf': frozen graph, 'opencv': (frozen graph, text graph, input size), 'tflite': model}
+    if backend == 'tf':
+        return TFSessionBackend(graph, graph_def, files['tf'], name, config)
+    if backend == 'opencv':
+        return OpenCVBackend(*files['opencv'])
+    if backend == 'tflite':
+        return TFLiteBackend(files['tflite'])
+    raise ValueError('Unknown backend: %s' % backend)
+
+
+class ObjectDetector:
+    # Base of the SSD detectors: the backend runs the model, subclasses turn its
+    # output into their own kind of detections in extract()
+    def __init__ (self, backend, category_index, min_score_thresh):
+        self.backend = backend
+        self.category_index = category_index
+        self.min_score_thresh = min_score_thresh
+
+    def run_batch(self, images):
+        # One single-image output dict per image, every array keeps a leading dimension of 1
+        output = self.backend.detect(images)
+        return [dict((name, value[i:i+1]) for name, value in output.items())
+                for i in range(len(images))]
+
+    def run(self, image):
+        return self.run_batch([image])[0]
+
+    def detect(self, image):
+        return self.detect_batch([image])[0]
+
+    def detect_batch(self, images):
+        return [self.extract(image, output_dict) for image, output_dict in zip(images, self.run_batch(images))]
+
+    def extract(self, image, output_dict):
+        raise NotImplementedError
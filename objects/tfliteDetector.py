@@ -0,0 +1,128 @@
+import os
+import threading
+
+import cv2
+import numpy as np
+
+try:
+    # The standalone runtime is much lighter than TensorFlow on edge boxes
+    from tflite_runtime.interpreter import Interpreter
+except ImportError:
+    import tensorflow as tf
+    Interpreter = tf.lite.Interpreter
+
+# SSD box coder scales from the models' pipeline.config (faster_rcnn_box_coder)
+BOX_SCALES = np.array([10.0, 10.0, 5.0, 5.0], dtype=np.float32)
+# Candidates below this score are dropped before non-max suppression; every caller
+# cuts at 0.3 or more anyway
+SCORE_FLOOR = 0.1
+IOU_THRESH = 0.6
+MAX_DETECTIONS = 100
+
+
+def anchorsPath(model_path):
+    return os.path.splitext(model_path)[0] + '_anchors.npy'
+
+
+def decodeBoxes(encodings, anchors):
+    # Inverse of the faster_rcnn box coder: (ty, tx, th, tw) relative to each anchor
+    # -> normalised (ymin, xmin, ymax, xmax)
+    ty, tx, th, tw = (encodings/BOX_SCALES).T
+    ya = (anchors[:, 0] + anchors[:, 2])/2
+    xa = (anchors[:, 1] + anchors[:, 3])/2
+    ha = anchors[:, 2] - anchors[:, 0]
+    wa = anchors[:, 3] - anchors[:, 1]
+    h = np.exp(th)*ha
+    w = np.exp(tw)*wa
+    yc = ty*ha + ya
+    xc = tx*wa + xa
+    return np.stack([yc - h/2, xc - w/2, yc + h/2, xc + w/2], axis=1)
+
+
+def normalise(image, width, height):
+    # What the frozen graphs do between image_tensor and Preprocessor/sub
+    resized = cv2.resize(image, (width, height), interpolation=cv2.INTER_LINEAR)
+    return resized.astype(np.float32)*(2.0/255.0) - 1.0
+
+
+class TFLiteSSD:
+    # Runs an SSD exported by detectors/tflite_export.py: the interpreter computes the raw
+    # box encodings and class logits, box decoding and non-max suppression (which the
+    # frozen graphs do in TensorFlow) happen here in NumPy/OpenCV. run_batch returns the
+    # same output dicts as a frozen graph's sess.run, so HumanDetector and CNNDetector
+    # extract detections from it unchanged.
+    def __init__ (self, model_path, num_threads=None):
+        self.interpreter = Interpreter(model_path=model_path, num_threads=num_threads) if num_threads \
+            else Interpreter(model_path=model_path)
+        self.interpreter.allocate_tensors()
+        # The interpreter keeps its tensors between invoke() calls
+        self.lock = threading.Lock()
+        self.anchors = np.load(anchorsPath(model_path))
+
+        self.input = self.interpreter.get_input_details()[0]
+        self.height, self.width = self.input['shape'][1:3]
+        outputs = self.interpreter.get_output_details()
+        # Box encodings are the output with 4 values per anchor, the other one is the class logits
+        self.boxOutput, self.classOutput = sorted(outputs, key=lambda detail: detail['shape'][-1] != 4)
+
+    def preprocess(self, image):
+        normalised = normalise(image, self.width, self.height)
+        scale, zero = self.input['quantization']
+        if self.input['dtype'] == np.float32 or scale == 0:
+            return normalised.astype(self.input['dtype'])
+        return np.clip(np.round(normalised/scale + zero), np.iinfo(self.input['dtype']).min,
+                       np.iinfo(self.input['dtype']).max).astype(self.input['dtype'])
+
+    def output(self, detail):
+        value = self.interpreter.get_tensor(detail['index'])
+        scale, zero = detail['quantization']
+        if value.dtype != np.float32 and scale != 0:
+            value = (value.astype(np.float32) - zero)*scale
+        return value
+
+    def run(self, image):
+        with self.lock:
+            self.interpreter.set_tensor(self.input['index'], np.expand_dims(self.preprocess(image), axis=0))
+            self.interpreter.invoke()
+            encodings = self.output(self.boxOutput).reshape(-1, 4)
+            logits = self.output(self.classOutput)
+        logits = logits.reshape(encodings.shape[0], -1)
+
+        # Sigmoid score converter, column 0 is the background class
+        scores = 1.0/(1.0 + np.exp(-logits[:, 1:]))
+        boxes = decodeBoxes(encodings, self.anchors)
+        return self.suppress(boxes, scores)
+
+    def run_batch(self, images):
+        # The exported models take one image per invoke()
+        return [self.run(image) for image in images]
+
+    def suppress(self, boxes, scores):
+        # Per-class non-max suppression, then the best MAX_DETECTIONS overall
+        anchor_ids, class_ids = np.nonzero(scores > SCORE_FLOOR)
+        kept = []
+        for class_id in np.unique(class_ids):
+            candidates = anchor_ids[class_ids == class_id]
+            candidate_boxes = boxes[candidates]
+            # NMSBoxes takes (x, y, w, h)
+            rects = np.stack([candidate_boxes[:, 1], candidate_boxes[:, 0],
+                              candidate_boxes[:, 3] - candidate_boxes[:, 1],
+                              candidate_boxes[:, 2] - candidate_boxes[:, 0]], axis=1)
+            keep = cv2.dnn.NMSBoxes(rects.tolist(), scores[candidates, class_id].tolist(), SCORE_FLOOR, IOU_THRESH)
+            for i in np.array(keep).reshape(-1):
+                kept.append((scores[candidates[i], class_id], candidates[i], class_id))
+
+        kept.sort(key=lambda k: -k[0])
+        kept = kept[:MAX_DETECTIONS]
+        detection_boxes = np.zeros((1, MAX_DETECTIONS, 4), dtype=np.float32)
+        detection_scores = np.zeros((1, MAX_DETECTIONS), dtype=np.float32)
+        detection_classes = np.zeros((1, MAX_DETECTIONS), dtype=np.float32)
+        for i, (score, anchor, class_id) in enumerate(kept):
+            detection_boxes[0, i] = np.clip(boxes[anchor], 0.0, 1.0)
+            detection_scores[0, i] = score
+            # Frozen graphs number classes from 1
+            detection_classes[0, i] = class_id + 1
+        return {'detection_boxes': detection_boxes,
+                'detection_scores': detection_scores,
+                'detection_classes': detection_classes,
+                'num_detections': np.array([len(kept)], dtype=np.float32)}
@@ -0,0 +1,51 @@
+from collections import namedtuple
+
+import numpy as np
+
+from object_detection.utils import np_box_ops
+
+# confidence: [people] highest score of a weapon matched to each person, 0 without one
+# best: [people] index of that weapon, -1 without one
+# matched: [people, weapons] whether the pair is associated
+# overlap: [people, weapons] the measure the pairs were compared on
+Association = namedtuple('Association', ['confidence', 'best', 'matched', 'overlap'])
+
+# ioa: share of the weapon's box inside the person's, iou: intersection over union
+MEASURES = {'ioa': np_box_ops.ioa,
+            'iou': np_box_ops.iou}
+
+
+def asBoxes(boxes):
+    return np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+
+
+def touching(boxes1, boxes2):
+    # [N, M] whether the boxes meet at all, edges included (like utils/common.isIntersect)
+    ymin1, xmin1, ymax1, xmax1 = [column[:, None] for column in boxes1.T]
+    ymin2, xmin2, ymax2, xmax2 = boxes2.T
+    return (ymin1 <= ymax2) & (ymin2 <= ymax1) & (xmin1 <= xmax2) & (xmin2 <= xmax1)
+
+
+def associate(people, weapons, scores, measure='ioa', min_overlap=0.0):
+    # people [N, 4] and weapons [M, 4]: normalised (ymin, xmin, ymax, xmax), scores [M].
+    # Every pair is compared in one go; with min_overlap 0 any contact associates a
+    # weapon with a person, otherwise the measure has to reach min_overlap.
+    people, weapons = asBoxes(people), asBoxes(weapons)
+    scores = np.asarray(scores, dtype=np.float64).reshape(-1)
+    if len(people) == 0 or len(weapons) == 0:
+        empty = np.zeros((len(people), len(weapons)))
+        return Association(np.zeros(len(people)), np.full(len(people), -1), empty.astype(bool), empty)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Degenerate (zero area) boxes divide by zero
+        overlap = np.nan_to_num(MEASURES[measure](people, weapons))
+    if min_overlap > 0:
+        matched = overlap >= min_overlap
+    else:
+        matched = touching(people, weapons)
+
+    candidates = np.where(matched, scores[None, :], -1.0)
+    best = np.argmax(candidates, axis=1)
+    found = matched.any(axis=1)
+    confidence = np.where(found, scores[best], 0.0)
+    return Association(confidence, np.where(found, best, -1), matched, overlap)
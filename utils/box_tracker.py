@@ -0,0 +1,169 @@
+import itertools
+
+import numpy as np
+import cv2
+
+from object_detection.utils import np_box_ops
+
+# Tracked boxes are kept if they overlap a fresh detection at least this much
+MATCH_IOU = 0.3
+# A flow vector agrees with its box's motion if it is within this many pixels of the median
+FLOW_DEVIATION = 1.5
+MAX_CORNERS = 20
+# Keyframes are forced when a track's coherence, averaged (geometric mean) over the frames
+# interpolated since the last keyframe, drops below this ...
+MIN_CONFIDENCE = 0.5
+# ... or when the frame's motion jumps to this multiple of its running average
+MOTION_SPIKE = 3.0
+MOTION_SMOOTHING = 0.1
+
+
+class Track:
+    def __init__ (self, trackId, box):
+        self.trackId = trackId
+        self.box = box # normalised (ymin, xmin, ymax, xmax)
+        self.confidence = 1.0
+        self.age = 0 # frames since the detector last confirmed this track
+        self.data = {}
+
+
+class BoxTracker:
+    # Carries detector boxes forward between keyframes. Boxes are moved by the median
+    # motion inside them, either from a dense flow field the caller already has or from
+    # sparse Lucas-Kanade on a few corners. A track's confidence is the product of the
+    # coherence of the motion inside its box on every interpolated frame, 0 once it has
+    # nothing left to follow.
+    def __init__ (self):
+        self.tracks = []
+        self.ids = itertools.count()
+
+    def reset(self, boxes):
+        # Keyframe: the detections replace the tracks, keeping ids (and data) of tracks they overlap
+        boxes = [tuple(float(v) for v in box) for box in boxes]
+        old = self.tracks
+        self.tracks = []
+        if len(boxes) == 0:
+            return self.tracks
+
+        matched = set()
+        if len(old) > 0:
+            iou = np_box_ops.iou(np.array(boxes, dtype=np.float64), np.array([t.box for t in old], dtype=np.float64))
+        for i, box in enumerate(boxes):
+            track = None
+            if len(old) > 0:
+                j = int(np.argmax(iou[i]))
+                if iou[i, j] >= MATCH_IOU and j not in matched:
+                    matched.add(j)
+                    track = old[j]
+                    track.box = box
+                    track.confidence = 1.0
+                    track.age = 0
+            if track is None:
+                track = Track(next(self.ids), box)
+            self.tracks.append(track)
+        return self.tracks
+
+    def propagateFlow(self, flow):
+        # flow: dense (height, width, 2) field from the previous frame to the current one
+        height, width = flow.shape[:2]
+        for track in self.tracks:
+            top, left, bottom, right = self.pixelBox(track.box, height, width)
+            region = flow[top:bottom, left:right].reshape(-1, 2)
+            self.move(track, region, height, width)
+        return self.tracks
+
+    def propagateSparse(self, prevGray, gray):
+        # For callers without a dense flow field: Lucas-Kanade on corners inside each box
+        height, width = gray.shape[:2]
+        for track in self.tracks:
+            top, left, bottom, right = self.pixelBox(track.box, height, width)
+            corners = cv2.goodFeaturesToTrack(prevGray[top:bottom, left:right], MAX_CORNERS, 0.01, 3)
+            if corners is None:
+                self.move(track, np.zeros((0, 2)), height, width)
+                continue
+            corners = (corners.reshape(-1, 2) + (left, top)).astype(np.float32)
+            moved, status, _ = cv2.calcOpticalFlowPyrLK(prevGray, gray, corners, None)
+            found = status.reshape(-1) == 1
+            self.move(track, (moved.reshape(-1, 2) - corners)[found], height, width, len(corners))
+        return self.tracks
+
+    def move(self, track, vectors, height, width, samples=None):
+        track.age += 1
+        if len(vectors) == 0:
+            track.confidence = 0.0
+            return
+
+        dx, dy = np.median(vectors, axis=0)
+        deviation = np.abs(vectors - (dx, dy)).max(axis=1)
+        coherence = np.count_nonzero(deviation <= FLOW_DEVIATION)/float(samples or len(vectors))
+        track.confidence *= coherence
+
+        ymin, xmin, ymax, xmax = track.box
+        dy, dx = dy/height, dx/width
+        track.box = (min(max(ymin + dy, 0.0), 1.0), min(max(xmin + dx, 0.0), 1.0),
+                     min(max(ymax + dy, 0.0), 1.0), min(max(xmax + dx, 0.0), 1.0))
+
+    def pixelBox(self, box, height, width):
+        top, left = int(box[0]*height), int(box[1]*width)
+        return top, left, max(int(box[2]*height), top + 1), max(int(box[3]*width), left + 1)
+
+    def boxes(self):
+        return [np.array(track.box) for track in self.tracks]
+
+    def minConfidence(self):
+        return min([track.confidence for track in self.tracks] or [1.0])
+
+
+class KeyframeScheduler:
+    # Runs the heavy detectors every `interval` frames, earlier if tracking gets shaky or
+    # the scene suddenly starts moving a lot more. interval=1 makes every frame a keyframe.
+    def __init__ (self, interval=1):
+        self.interval = interval
+        self.sinceKeyframe = None
+        self.averageMotion = None
+
+        self.keyframes = 0
+        self.scheduled = 0
+        self.forced = 0
+        self.forcedConfidence = 0
+        self.forcedMotion = 0
+        self.interpolated = 0
+
+    def isKeyframe(self, confidence=1.0, motion=None):
+        spike = False
+        if motion is not None:
+            if self.averageMotion is not None and self.averageMotion > 0:
+                spike = motion > MOTION_SPIKE*self.averageMotion
+            if self.averageMotion is None:
+                self.averageMotion = motion
+            else:
+                self.averageMotion += MOTION_SMOOTHING*(motion - self.averageMotion)
+
+        due = self.sinceKeyframe is None or self.sinceKeyframe + 1 >= self.interval
+        # confidence is the product of one coherence per frame interpolated so far, so its
+        # geometric mean is below MIN_CONFIDENCE exactly when the product is below this
+        shaky = confidence < MIN_CONFIDENCE**(self.sinceKeyframe or 0)
+        if due or spike or shaky:
+            if due:
+                self.scheduled += 1
+            else:
+                self.forced += 1
+                if shaky:
+                    self.forcedConfidence += 1
+                else:
+                    self.forcedMotion += 1
+            self.keyframes += 1
+            self.sinceKeyframe = 0
+            return True
+
+        self.interpolated += 1
+        self.sinceKeyframe += 1
+        return False
+
+    def getStats(self):
+        return {'keyframes': self.keyframes,
+                'scheduled': self.scheduled,
+                'forced': self.forced,
+                'forced_confidence': self.forcedConfidence,
+                'forced_motion': self.forcedMotion,
+                'interpolated': self.interpolated}
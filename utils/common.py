@@ -34,3 +34,32 @@ def isIntersect(human, knife):
     if amin_y > othermax_y or amax_y < othermin_y:
         return False
     return True
+
+
+def cropRegions(image, boxes, padding, size):
+    # Crops the normalised (ymin, xmin, ymax, xmax) boxes out of image, grown by padding
+    # times their size on every side, and resizes each crop to size x size so they can be
+    # batched. Returns the crops and the normalised region each one covers.
+    height, width = image.shape[:2]
+    crops = []
+    regions = []
+    for box in boxes:
+        ymin, xmin, ymax, xmax = box
+        pad_y = (ymax - ymin)*padding
+        pad_x = (xmax - xmin)*padding
+        region = (max(ymin - pad_y, 0.0), max(xmin - pad_x, 0.0), min(ymax + pad_y, 1.0), min(xmax + pad_x, 1.0))
+
+        top, left = int(region[0]*height), int(region[1]*width)
+        bottom, right = max(int(region[2]*height), top + 1), max(int(region[3]*width), left + 1)
+        crops.append(cv2.resize(image[top:bottom, left:right], (size, size)))
+        regions.append(region)
+    return crops, regions
+
+
+def mapToFrame(box, region):
+    # Converts a box normalised to a crop back to coordinates normalised to the whole frame
+    ymin, xmin, ymax, xmax = box
+    height = region[2] - region[0]
+    width = region[3] - region[1]
+    return (region[0] + ymin*height, region[1] + xmin*width,
+            region[0] + ymax*height, region[1] + xmax*width)
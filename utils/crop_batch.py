@@ -0,0 +1,32 @@
+import numpy as np
+import cv2
+
+
+class CropBatch:
+    # A reusable float32 [n, size, size, 3] batch that crops are resized and normalised
+    # straight into. Only two buffers exist per detector, both grown on demand and kept:
+    # a uint8 resize target and the float32 batch the classifier is fed.
+    def __init__ (self, size, capacity=4, interpolation=cv2.INTER_LINEAR):
+        self.size = size
+        self.interpolation = interpolation
+        self.resized = np.empty((size, size, 3), dtype=np.uint8)
+        self.batch = np.empty((capacity, size, size, 3), dtype=np.float32)
+        self.count = 0
+
+    def reset(self):
+        self.count = 0
+
+    def add(self, crop):
+        if self.count == len(self.batch):
+            grown = np.empty((2*len(self.batch),) + self.batch.shape[1:], dtype=np.float32)
+            grown[:self.count] = self.batch[:self.count]
+            self.batch = grown
+
+        cv2.resize(crop, (self.size, self.size), dst=self.resized, interpolation=self.interpolation)
+        # Min-max to [-0.5, 0.5] per crop, written into the batch slot without a temporary
+        cv2.normalize(self.resized, self.batch[self.count], -0.5, 0.5, cv2.NORM_MINMAX, dtype=cv2.CV_32F)
+        self.count += 1
+
+    def crops(self):
+        # View of the crops added since reset(), only valid until the next add()
+        return self.batch[:self.count]
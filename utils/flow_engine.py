@@ -0,0 +1,169 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+# Sparse mode tracks a grid of points with this spacing (pixels) inside each box
+GRID_STEP = 4
+# ROI mode grows every box by this fraction of its size on each side, so the flow
+# window sees some background around the person
+ROI_PADDING = 0.2
+# Regions smaller than this (pixels, either side) are too small to compute flow in
+MIN_REGION = 16
+# Striped mode: rows every stripe computes beyond its own on both sides. Farneback's
+# 15 px window at the coarsest of its 3 pyramid levels reaches 15*2^3 = 120 rows; with
+# this much overlap per-person mean motion stays within 0.06 px of a whole frame call
+# (see Algorithm Testing/benchmark_striped_flow.py), with less the seams show
+STRIPE_OVERLAP = 128
+
+DIS_PRESETS = {'ultrafast': cv2.DISOpticalFlow_PRESET_ULTRAFAST,
+               'fast': cv2.DISOpticalFlow_PRESET_FAST,
+               'medium': cv2.DISOpticalFlow_PRESET_MEDIUM}
+
+
+def pixelRegions(boxes, height, width, padding=0.0):
+    # Normalised (ymin, xmin, ymax, xmax) boxes to (top, left, bottom, right) pixel regions
+    regions = []
+    for ymin, xmin, ymax, xmax in boxes:
+        pad_y, pad_x = (ymax - ymin)*padding, (xmax - xmin)*padding
+        top, left = int(max(ymin - pad_y, 0.0)*height), int(max(xmin - pad_x, 0.0)*width)
+        bottom, right = int(min(ymax + pad_y, 1.0)*height), int(min(xmax + pad_x, 1.0)*width)
+        if bottom - top >= MIN_REGION and right - left >= MIN_REGION:
+            regions.append((top, left, bottom, right))
+    return regions
+
+
+class FlowEngine:
+    # Flow from prevgray to gray as an (height, width, 2) float32 field of pixel displacements.
+    # boxes are the normalised regions the caller needs motion in (people, knives); engines
+    # with local = True only compute flow there and leave the rest of the field at zero.
+    local = False
+
+    def compute(self, prevgray, gray, boxes=()):
+        raise NotImplementedError
+
+
+class FarnebackFlow(FlowEngine):
+    # Dense over the whole frame, what OpticalflowDetector has always used
+    def __init__ (self, pyr_scale=0.5, levels=3, winsize=15, iterations=3, poly_n=5, poly_sigma=1.2):
+        self.params = (pyr_scale, levels, winsize, iterations, poly_n, poly_sigma, 0)
+
+    def compute(self, prevgray, gray, boxes=()):
+        return cv2.calcOpticalFlowFarneback(prevgray, gray, None, *self.params)
+
+
+class DISFlow(FlowEngine):
+    # OpenCV's dense inverse search, several times cheaper than Farneback at its fast presets
+    def __init__ (self, preset='fast'):
+        self.dis = cv2.DISOpticalFlow_create(DIS_PRESETS[preset])
+
+    def compute(self, prevgray, gray, boxes=()):
+        return self.dis.calc(prevgray, gray, None)
+
+
+class SparseFlow(FlowEngine):
+    # Pyramidal Lucas-Kanade on a grid of points inside each box. Every point's
+    # displacement fills its grid cell, so box statistics work as on a dense field.
+    local = True
+
+    def __init__ (self, step=GRID_STEP, winSize=(15, 15), maxLevel=2):
+        self.step = step
+        self.params = dict(winSize=winSize, maxLevel=maxLevel)
+
+    def compute(self, prevgray, gray, boxes=()):
+        height, width = gray.shape[:2]
+        flow = np.zeros((height, width, 2), dtype=np.float32)
+        regions = pixelRegions(boxes, height, width)
+        if len(regions) == 0:
+            return flow
+
+        points = np.concatenate([np.mgrid[top:bottom:self.step, left:right:self.step].reshape(2, -1).T
+                                 for top, left, bottom, right in regions])
+        # Boxes overlap, every cell is tracked once
+        points = np.unique(points, axis=0)
+        corners = points[:, ::-1].astype(np.float32) + self.step/2.0
+        moved, status, _ = cv2.calcOpticalFlowPyrLK(prevgray, gray, corners, None, **self.params)
+        vectors = (moved - corners)*(status == 1)
+
+        # One vector per cell, spread over the cell
+        cells = np.zeros((int(np.ceil(height/float(self.step))), int(np.ceil(width/float(self.step))), 2),
+                         dtype=np.float32)
+        cells[points[:, 0]//self.step, points[:, 1]//self.step] = vectors
+        spread = np.repeat(np.repeat(cells, self.step, axis=0), self.step, axis=1)[:height, :width]
+        for top, left, bottom, right in regions:
+            flow[top:bottom, left:right] = spread[top:bottom, left:right]
+        return flow
+
+
+class ROIFlow(FlowEngine):
+    # Another engine, run only on the padded boxes instead of the whole frame
+    local = True
+
+    def __init__ (self, engine=None, padding=ROI_PADDING):
+        self.engine = engine if engine is not None else FarnebackFlow()
+        self.padding = padding
+
+    def compute(self, prevgray, gray, boxes=()):
+        height, width = gray.shape[:2]
+        flow = np.zeros((height, width, 2), dtype=np.float32)
+        for top, left, bottom, right in pixelRegions(boxes, height, width, self.padding):
+            # Some engines (DIS) only take contiguous images
+            flow[top:bottom, left:right] = self.engine.compute(np.ascontiguousarray(prevgray[top:bottom, left:right]),
+                                                               np.ascontiguousarray(gray[top:bottom, left:right]))
+        return flow
+
+
+class StripedFlow(FlowEngine):
+    # A dense engine split over horizontal stripes on a thread pool, for frames large enough
+    # that one flow call becomes the slowest stage. OpenCV releases the GIL, so the stripes
+    # really run in parallel. Every stripe is computed with STRIPE_OVERLAP extra rows and
+    # only its own rows are kept, so the seams match a single call over the whole frame.
+    def __init__ (self, factory=FarnebackFlow, stripes=None, overlap=STRIPE_OVERLAP):
+        if stripes is None:
+            stripes = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+        self.stripes = max(stripes, 1)
+        self.overlap = overlap
+        # Engines such as DIS keep state, one per stripe
+        self.engines = [factory() for _ in range(self.stripes)]
+        self.executor = ThreadPoolExecutor(self.stripes) if self.stripes > 1 else None
+
+    def bounds(self, height):
+        edges = np.linspace(0, height, self.stripes + 1).astype(int)
+        return [(top, bottom) for top, bottom in zip(edges, edges[1:]) if bottom > top]
+
+    def computeStripe(self, engine, prevgray, gray, top, bottom, out):
+        start, end = max(top - self.overlap, 0), min(bottom + self.overlap, gray.shape[0])
+        flow = engine.compute(prevgray[start:end], gray[start:end])
+        out[top:bottom] = flow[top - start:bottom - start]
+
+    def compute(self, prevgray, gray, boxes=()):
+        height, width = gray.shape[:2]
+        flow = np.empty((height, width, 2), dtype=np.float32)
+        stripes = self.bounds(height)
+        if self.executor is None or len(stripes) == 1:
+            self.computeStripe(self.engines[0], prevgray, gray, 0, height, flow)
+            return flow
+        futures = [self.executor.submit(self.computeStripe, engine, prevgray, gray, top, bottom, flow)
+                   for engine, (top, bottom) in zip(self.engines, stripes)]
+        for future in futures:
+            future.result()
+        return flow
+
+
+ENGINES = {'farneback': FarnebackFlow,
+           'dis': lambda: DISFlow('fast'),
+           'dis-ultrafast': lambda: DISFlow('ultrafast'),
+           'sparse': SparseFlow,
+           'roi': ROIFlow,
+           'roi-dis': lambda: ROIFlow(DISFlow('ultrafast')),
+           'striped': StripedFlow}
+DEFAULT_ENGINE = 'farneback'
+
+
+def createFlowEngine(name=DEFAULT_ENGINE):
+    if isinstance(name, FlowEngine):
+        return name
+    if name not in ENGINES:
+        raise ValueError('Unknown flow engine: %s' % name)
+    return ENGINES[name]()
@@ -0,0 +1,200 @@
+import threading
+import time
+import logging
+from collections import namedtuple
+
+import cv2
+
+logger = logging.getLogger("Frame Hub")
+
+# Every frame handed out by the hub is stamped with a monotonically increasing
+# sequence number and the wall clock time it was read off the device.
+# The image is shared between all subscribers, so treat it as read-only.
+Frame = namedtuple('Frame', ['seq', 'timestamp', 'image'])
+
+READ_RETRY_DELAY = 0.01
+
+
+class Subscription:
+    def __init__ (self, hub, name, notify=None):
+        self.hub = hub
+        self.name = name
+        # Optional callable invoked from the capture thread whenever a new frame lands
+        self.notify = notify
+        self.condition = threading.Condition()
+        self.pending = None
+        self.closed = False
+        # Set when the hub's source ran out, so readers stop waiting for frames
+        self.ended = False
+
+        self.received = 0
+        self.consumed = 0
+        self.dropped = 0
+
+    def push(self, frame):
+        # Latest frame wins: a frame that was never read is overwritten and counted as dropped
+        with self.condition:
+            if self.pending is not None:
+                self.dropped += 1
+            self.pending = frame
+            self.ended = False
+            self.received += 1
+            self.condition.notify_all()
+        if self.notify is not None:
+            self.notify()
+
+    def ready(self):
+        return self.pending is not None
+
+    def exhausted(self):
+        # Nothing more will arrive: read() keeps returning None at once, so stop calling it
+        with self.condition:
+            return self.pending is None and (self.closed or self.ended)
+
+    def end(self):
+        with self.condition:
+            self.ended = True
+            self.condition.notify_all()
+
+    def read(self, timeout=None):
+        # Blocks until a frame newer than the last one read is available.
+        # Returns None on timeout, once the subscription is closed or once the source has ended
+        with self.condition:
+            self.condition.wait_for(lambda: self.pending is not None or self.closed or self.ended, timeout)
+            frame = self.pending
+            self.pending = None
+            if frame is not None:
+                self.consumed += 1
+            return frame
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.hub.unsubscribe(self)
+
+    def getStats(self):
+        with self.condition:
+            return {'name': self.name,
+                    'received': self.received,
+                    'consumed': self.consumed,
+                    'dropped': self.dropped}
+
+
+class FrameHub:
+    def __init__ (self, source=0):
+        # source is a device index / file path for cv2.VideoCapture, a callable that opens
+        # a capture (e.g. lambda: openSource(path)), or a capture that is already open.
+        # The hub reopens the first two every time it starts; an open capture belongs to
+        # the caller and is never released, so it cannot be restarted once it has run out.
+        self.source = source
+        self.capture = None
+        self.owned = False
+        self.thread = None
+        self.running = False
+        # Guards the subscriber list; control serialises starting and stopping
+        self.lock = threading.Lock()
+        self.control = threading.Lock()
+        self.subscribers = []
+
+        self.seq = 0
+        self.failedReads = 0
+        self.latestFrame = None
+
+    def open(self):
+        if callable(self.source):
+            self.owned = True
+            return self.source()
+        if hasattr(self.source, 'read'):
+            self.owned = False
+            return self.source
+        self.owned = True
+        return cv2.VideoCapture(self.source)
+
+    def start(self):
+        with self.control:
+            self.startLocked()
+
+    def stop(self):
+        with self.control:
+            self.stopLocked()
+
+    def startLocked(self):
+        if self.running:
+            return
+        # The capture thread may have ended on its own when the source ran out
+        self.release()
+        self.capture = self.open()
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='FrameHub-%s' % (self.source,))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stopLocked(self):
+        self.running = False
+        self.release()
+
+    def release(self):
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+        if self.capture is not None and self.owned:
+            self.capture.release()
+        self.capture = None
+
+    def subscribe(self, name, notify=None):
+        subscription = Subscription(self, name, notify)
+        with self.control:
+            with self.lock:
+                self.subscribers.append(subscription)
+            self.startLocked()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.control:
+            with self.lock:
+                if subscription in self.subscribers:
+                    self.subscribers.remove(subscription)
+                empty = len(self.subscribers) == 0
+            # Release the device once nobody is watching it any more
+            if empty:
+                self.stopLocked()
+        logger.info('%s: received %d, consumed %d, dropped %d frames' % (subscription.name,
+            subscription.received, subscription.consumed, subscription.dropped))
+
+    def latest(self):
+        return self.latestFrame
+
+    def run(self):
+        while self.running:
+            grabbed, image = self.capture.read()
+            if not grabbed:
+                # Replayed files run out, cameras only hiccup
+                if getattr(self.capture, 'finished', False):
+                    logger.info('Source %s finished' % (self.source,))
+                    # The next subscribe() reopens the source; readers stop waiting
+                    self.running = False
+                    with self.lock:
+                        subscribers = list(self.subscribers)
+                    for subscription in subscribers:
+                        subscription.end()
+                    break
+                self.failedReads += 1
+                time.sleep(READ_RETRY_DELAY)
+                continue
+
+            frame = Frame(self.seq, time.time(), image)
+            self.seq += 1
+            self.latestFrame = frame
+
+            with self.lock:
+                subscribers = list(self.subscribers)
+            for subscription in subscribers:
+                subscription.push(frame)
+
+    def getStats(self):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        return {'captured': self.seq,
+                'failed_reads': self.failedReads,
+                'subscribers': [s.getStats() for s in subscribers]}
@@ -0,0 +1,117 @@
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+# Brightness is estimated on a grayscale thumbnail of this width
+THUMB_WIDTH = 64
+HIST_BINS = 32
+# Dark frames are brightened until their median grey level reaches this (0-1) ...
+TARGET_LEVEL = 0.5
+# ... frames whose median is already above this are left alone, gamma correction
+# also washes out and blurs the image (see README)
+BRIGHT_LEVEL = 0.45
+MAX_GAMMA = 3.0
+# Gammas are rounded to this step, so only a handful of lookup tables ever exist
+GAMMA_STEP = 0.1
+# Weight of the newest frame in the smoothed gamma, keeps it from flickering
+SMOOTHING = 0.1
+# Gammas chosen for the last few frame keys; detectors sharing a corrector work through the
+# frames at their own pace, so their keys interleave
+KEY_CACHE = 8
+
+# {gamma: lookup table}, shared by every detector in the process
+tables = {}
+
+
+def quantise(gamma):
+    return round(gamma/GAMMA_STEP)*GAMMA_STEP
+
+
+def gammaTable(gamma):
+    # Maps the pixel values [0, 255] to their gamma adjusted values
+    gamma = quantise(gamma)
+    table = tables.get(gamma)
+    if table is None:
+        table = ((np.arange(256)/255.0)**(1.0/gamma)*255).astype(np.uint8)
+        tables[gamma] = table
+    return table
+
+
+def adjustGamma(image, gamma=1.0):
+    if quantise(gamma) == 1.0:
+        return image
+    return cv2.LUT(image, gammaTable(gamma))
+
+
+def estimateGamma(frame):
+    # Gamma that brings the frame's median grey level up to TARGET_LEVEL, 1 for bright frames
+    height, width = frame.shape[:2]
+    size = (THUMB_WIDTH, max(1, int(round(height*THUMB_WIDTH/float(width)))))
+    small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    hist = cv2.calcHist([small], [0], None, [HIST_BINS], [0, 256]).ravel()
+    cdf = np.cumsum(hist)
+    median = (np.searchsorted(cdf, cdf[-1]/2.0) + 0.5)/HIST_BINS
+    if median >= BRIGHT_LEVEL:
+        return 1.0
+    return min(MAX_GAMMA, np.log(median)/np.log(TARGET_LEVEL))
+
+
+class GammaCorrector:
+    # The low light enhancement in front of the models. The gamma follows the scene's
+    # brightness, smoothed over time; a fixed gamma turns the estimate off.
+    # Detectors on the same stream share one corrector, the frame key makes sure
+    # every detector brightens a frame the same way and the estimate moves once per frame.
+    def __init__ (self, gamma=None):
+        self.fixed = gamma
+        self.gamma = gamma if gamma is not None else 1.0
+        # {frame key: gamma}, oldest first
+        self.keys = OrderedDict()
+        self.estimated = False
+        # Detectors on different threads may share a corrector
+        self.lock = threading.Lock()
+
+        self.frames = 0
+        self.corrected = 0
+
+    def update(self, frame, key=None):
+        if self.fixed is not None:
+            return self.gamma
+        with self.lock:
+            if key is not None and key in self.keys:
+                return self.keys[key]
+            estimate = estimateGamma(frame)
+            if not self.estimated:
+                self.gamma = estimate
+                self.estimated = True
+            else:
+                self.gamma += SMOOTHING*(estimate - self.gamma)
+            if key is not None:
+                self.keys[key] = self.gamma
+                if len(self.keys) > KEY_CACHE:
+                    self.keys.popitem(last=False)
+            return self.gamma
+
+    def correct(self, frame, key=None):
+        # Brightens frame (the detector's scaled copy) for the models
+        gamma = self.update(frame, key)
+        self.frames += 1
+        if quantise(gamma) <= 1.0:
+            return frame
+        self.corrected += 1
+        return adjustGamma(frame, gamma)
+
+    def apply(self, image, key=None):
+        # The gamma of frame key on another image of it, e.g. a full resolution crop
+        with self.lock:
+            gamma = self.keys.get(key, self.gamma) if key is not None else self.gamma
+        return adjustGamma(image, gamma)
+
+    def getStats(self):
+        return {'gamma': self.gamma,
+                'frames': self.frames,
+                'corrected': self.corrected,
+                'skipped': self.frames - self.corrected}
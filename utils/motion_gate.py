@@ -0,0 +1,99 @@
+import time
+import logging
+
+import cv2
+import numpy as np
+
+# Frames are compared as tiny grayscale thumbnails of this width
+GATE_WIDTH = 64
+# A thumbnail pixel has changed if it moved by more than this many grey levels ...
+PIXEL_THRESH = 12
+# ... and the scene has changed if more than this fraction of the pixels did
+CHANGED_FRACTION = 0.01
+# Frames identical to the one before are duplicates; this many in a row is a frozen feed
+FROZEN_FRAMES = 30
+# Even a static scene goes through the models this often, in seconds, so that
+# someone standing still with a weapon is not missed forever
+RECHECK_INTERVAL = 2.0
+
+logger = logging.getLogger("Motion Gate")
+
+ch = logging.StreamHandler()
+ch.setLevel(logging.DEBUG)
+logger.addHandler(ch)
+
+
+class MotionGate:
+    # Decides, before any model runs, whether a frame is worth running the models on.
+    # The frame is compared against the last frame that went through the models, so
+    # slow drift still adds up to a change eventually.
+    def __init__ (self, recheck_interval=RECHECK_INTERVAL, changed_fraction=CHANGED_FRACTION):
+        self.recheck_interval = recheck_interval
+        self.changed_fraction = changed_fraction
+        self.reference = None
+        self.previous = None
+        self.lastRun = 0
+        self.duplicateRun = 0
+        self.frozen = False
+
+        self.checked = 0
+        self.changed = 0
+        self.static = 0
+        self.duplicates = 0
+        self.rechecks = 0
+
+    def thumbnail(self, frame):
+        height, width = frame.shape[:2]
+        size = (GATE_WIDTH, max(1, int(round(height*GATE_WIDTH/float(width)))))
+        small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return small
+
+    def check(self, frame):
+        # True if the models should run on this frame, False to reuse the last results
+        self.checked += 1
+        small = self.thumbnail(frame)
+        now = time.time()
+
+        duplicate = self.previous is not None and not np.any(cv2.absdiff(small, self.previous))
+        self.previous = small
+        if duplicate:
+            self.duplicates += 1
+            self.duplicateRun += 1
+            if self.duplicateRun >= FROZEN_FRAMES and not self.frozen:
+                self.frozen = True
+                logger.warning('Feed looks frozen, %d identical frames in a row' % self.duplicateRun)
+        else:
+            if self.frozen:
+                logger.warning('Feed is moving again after %d identical frames' % self.duplicateRun)
+            self.duplicateRun = 0
+            self.frozen = False
+
+        if self.reference is None:
+            changed = True
+        elif duplicate:
+            changed = False
+        else:
+            diff = cv2.absdiff(small, self.reference)
+            changed = np.count_nonzero(diff > PIXEL_THRESH) > self.changed_fraction*diff.size
+
+        if changed:
+            self.changed += 1
+        elif now - self.lastRun >= self.recheck_interval:
+            self.rechecks += 1
+        else:
+            self.static += 1
+            return False
+
+        self.reference = small
+        self.lastRun = now
+        return True
+
+    def getStats(self):
+        return {'checked': self.checked,
+                'changed': self.changed,
+                'static': self.static,
+                'duplicates': self.duplicates,
+                'rechecks': self.rechecks,
+                'frozen': self.frozen}
@@ -0,0 +1,54 @@
+import cv2
+import numpy as np
+
+# Side, in pixels, of the square window peakEnergy() looks for the most motion in
+PEAK_WINDOW = 8
+
+
+def pixelBoxes(boxes, height, width):
+    # Normalised (ymin, xmin, ymax, xmax) boxes to int arrays of rows and columns,
+    # [top, bottom) x [left, right), at least one pixel each
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    top = np.clip((boxes[:, 0]*height).astype(int), 0, height - 1)
+    left = np.clip((boxes[:, 1]*width).astype(int), 0, width - 1)
+    bottom = np.clip(np.maximum((boxes[:, 2]*height).astype(int), top + 1), 1, height)
+    right = np.clip(np.maximum((boxes[:, 3]*width).astype(int), left + 1), 1, width)
+    return top, left, bottom, right
+
+
+class MotionStats:
+    # Summed-area tables of a flow magnitude field, built once per frame. Any number of
+    # boxes then costs four lookups each, however large they are.
+    def __init__ (self, mag):
+        self.height, self.width = mag.shape[:2]
+        self.sums, self.squares = cv2.integral2(mag, sdepth=cv2.CV_64F, sqdepth=cv2.CV_64F)
+        self.peaks = None
+
+    def boxSums(self, table, top, left, bottom, right):
+        return table[bottom, right] - table[top, right] - table[bottom, left] + table[top, left]
+
+    def means(self, boxes):
+        top, left, bottom, right = pixelBoxes(boxes, self.height, self.width)
+        area = (bottom - top)*(right - left)
+        return self.boxSums(self.sums, top, left, bottom, right)/area
+
+    def variances(self, boxes):
+        top, left, bottom, right = pixelBoxes(boxes, self.height, self.width)
+        area = (bottom - top)*(right - left)
+        means = self.boxSums(self.sums, top, left, bottom, right)/area
+        return np.maximum(self.boxSums(self.squares, top, left, bottom, right)/area - means**2, 0.0)
+
+    def peakEnergy(self, boxes, window=PEAK_WINDOW):
+        # Mean motion of the busiest window x window square inside every box, e.g. an arm
+        # moving fast while the rest of the person stands still
+        if self.peaks is None or self.peaks[0] != window:
+            rows = np.arange(self.height + 1)
+            cols = np.arange(self.width + 1)
+            top, bottom = np.maximum(rows[:-1] - window//2, 0), np.minimum(rows[:-1] + window - window//2, self.height)
+            left, right = np.maximum(cols[:-1] - window//2, 0), np.minimum(cols[:-1] + window - window//2, self.width)
+            top, bottom = top[:, None], bottom[:, None]
+            area = (bottom - top)*(right - left)
+            self.peaks = (window, self.boxSums(self.sums, top, left, bottom, right)/area)
+        energy = self.peaks[1]
+        top, left, bottom, right = pixelBoxes(boxes, self.height, self.width)
+        return np.array([energy[t:b, l:r].max() for t, l, b, r in zip(top, left, bottom, right)])
@@ -0,0 +1,96 @@
+import time
+import logging
+from collections import namedtuple
+
+# scale: resize factor applied to camera frames before the models,
+# keyframe_interval: frames between detector runs (tracked in between),
+# stride: the detector only looks at every stride-th frame
+QualityLevel = namedtuple('QualityLevel', ['scale', 'keyframe_interval', 'stride'])
+
+# Best first; level 0 is what the detectors do without a controller
+LEVELS = [QualityLevel(0.3, 1, 1),
+          QualityLevel(0.3, 2, 1),
+          QualityLevel(0.3, 3, 2),
+          QualityLevel(0.25, 4, 2),
+          QualityLevel(0.2, 6, 3)]
+
+# Weight of the newest frame time in the moving average
+SMOOTHING = 0.1
+# Frames the budget has to be missed (or met with headroom) in a row before the level changes
+PATIENCE = 10
+RECOVERY = 60
+# Step back up only once frames take less than this share of the budget
+HEADROOM = 0.6
+
+logger = logging.getLogger("Quality Controller")
+logger.setLevel(logging.INFO)
+
+ch = logging.StreamHandler()
+ch.setLevel(logging.DEBUG)
+logger.addHandler(ch)
+
+
+class QualityController:
+    # Holds a stream at a target frame rate (or latency) by trading detection quality for
+    # time: when frames take longer than the budget it steps down a level, and once there
+    # is plenty of headroom again it steps back up. Falling behind is quick to react to,
+    # recovering is deliberately slow so the level does not flap.
+    def __init__ (self, target_fps=None, target_latency=None, levels=LEVELS, name='stream'):
+        if target_fps is None and target_latency is None:
+            raise ValueError('A target fps or latency is needed')
+        self.budget = target_latency if target_latency is not None else 1.0/target_fps
+        self.levels = levels
+        self.name = name
+        self.level = 0
+        self.average = None
+        self.over = 0
+        self.under = 0
+        self.changes = []
+
+    def current(self):
+        return self.levels[self.level]
+
+    def update(self, frameTime):
+        # frameTime: seconds the last frame took (processing time or end to end latency).
+        # Returns the new QualityLevel when the level changed, None otherwise.
+        if self.average is None:
+            self.average = frameTime
+        else:
+            self.average += SMOOTHING*(frameTime - self.average)
+
+        if self.average > self.budget:
+            self.over += 1
+            self.under = 0
+        elif self.average < HEADROOM*self.budget:
+            self.under += 1
+            self.over = 0
+        else:
+            self.over = 0
+            self.under = 0
+
+        if self.over >= PATIENCE and self.level < len(self.levels) - 1:
+            return self.change(self.level + 1)
+        if self.under >= RECOVERY and self.level > 0:
+            return self.change(self.level - 1)
+        return None
+
+    def change(self, level):
+        previous = self.level
+        self.level = level
+        self.over = 0
+        self.under = 0
+        quality = self.levels[level]
+        self.changes.append((time.time(), previous, level, self.average))
+        # One line per change, in a fixed key=value form for log based metrics
+        logger.info('quality_change stream=%s from=%d to=%d frame_time=%.4f budget=%.4f scale=%.2f '
+                    'keyframe_interval=%d stride=%d' % (self.name, previous, level, self.average, self.budget,
+                    quality.scale, quality.keyframe_interval, quality.stride))
+        # Judge the new level on its own frames only
+        self.average = None
+        return quality
+
+    def getStats(self):
+        return {'level': self.level,
+                'changes': len(self.changes),
+                'frame_time': self.average or 0,
+                'budget': self.budget}
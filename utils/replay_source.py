@@ -0,0 +1,138 @@
+import os
+import time
+import logging
+
+import cv2
+
+# Clocks: REALTIME paces frames at the recorded rate and drops the ones the consumer
+# was too slow for, like a live camera would. FAST hands out every frame immediately.
+REALTIME = 'realtime'
+FAST = 'fast'
+CLOCKS = (REALTIME, FAST)
+
+# Frame directories carry no timing information
+DEFAULT_FPS = 30
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+logger = logging.getLogger("Replay Source")
+
+
+class ReplaySource:
+    # Drop-in replacement for cv2.VideoCapture that replays a video file or a
+    # directory of frames (e.g. output-0001.jpg, output-0002.jpg, ...)
+    def __init__ (self, path, clock=REALTIME, fps=None, loop=False):
+        if clock not in CLOCKS:
+            raise ValueError('Unknown clock: %s' % clock)
+
+        self.path = path
+        self.clock = clock
+        self.loop = loop
+        self.frames = None
+        self.capture = None
+
+        if os.path.isdir(path):
+            self.frames = sorted(os.path.join(path, name) for name in os.listdir(path)
+                                 if name.lower().endswith(IMAGE_EXTENSIONS))
+            recordedFps = DEFAULT_FPS
+            self.frameCount = len(self.frames)
+        else:
+            self.capture = cv2.VideoCapture(path)
+            recordedFps = self.capture.get(cv2.CAP_PROP_FPS) or DEFAULT_FPS
+            self.frameCount = int(self.capture.get(cv2.CAP_PROP_FRAME_COUNT))
+
+        self.fps = fps if fps else recordedFps
+        self.index = 0 # index of the next frame to be read
+        self.startTime = None
+        self.skipped = 0
+        self.finished = False
+
+    def isOpened(self):
+        if self.frames is not None:
+            return len(self.frames) > 0
+        return self.capture is not None and self.capture.isOpened()
+
+    def read(self):
+        if self.finished:
+            return False, None
+
+        if self.clock == REALTIME:
+            self.wait()
+
+        grabbed, frame = self.next()
+        if not grabbed and self.loop and self.index > 0:
+            self.rewind()
+            grabbed, frame = self.next()
+        if not grabbed:
+            logger.info('%s: replay finished after %d frames, %d skipped' % (self.path, self.index, self.skipped))
+            self.finished = True
+        return grabbed, frame
+
+    def wait(self):
+        now = time.time()
+        if self.startTime is None:
+            self.startTime = now - self.index/self.fps
+
+        due = self.startTime + self.index/self.fps
+        if now < due:
+            time.sleep(due - now)
+            return
+
+        # The consumer fell behind the recording, skip the frames a live camera would have dropped
+        target = int((now - self.startTime)*self.fps)
+        while self.index < target and self.skip():
+            self.skipped += 1
+
+    def next(self):
+        if self.frames is not None:
+            if self.index >= len(self.frames):
+                return False, None
+            frame = cv2.imread(self.frames[self.index])
+            self.index += 1
+            return frame is not None, frame
+
+        grabbed, frame = self.capture.read()
+        if grabbed:
+            self.index += 1
+        return grabbed, frame
+
+    def skip(self):
+        if self.frames is not None:
+            if self.index >= len(self.frames):
+                return False
+            self.index += 1
+            return True
+
+        # grab() advances without converting the frame
+        grabbed = self.capture.grab()
+        if grabbed:
+            self.index += 1
+        return grabbed
+
+    def rewind(self):
+        if self.capture is not None:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        self.index = 0
+        self.startTime = None
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return self.index
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return self.frameCount
+        if self.capture is not None:
+            return self.capture.get(prop)
+        return 0
+
+    def release(self):
+        if self.capture is not None:
+            self.capture.release()
+        self.finished = True
+
+
+def openSource(source, clock=REALTIME, loop=False):
+    # Camera indexes (ints or digit strings) open the device, anything else is replayed from disk
+    if isinstance(source, int) or (isinstance(source, str) and source.isdigit()):
+        return cv2.VideoCapture(int(source))
+    return ReplaySource(source, clock=clock, loop=loop)
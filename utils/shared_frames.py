@@ -0,0 +1,123 @@
+import logging
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from utils.frame_hub import Frame
+
+EMPTY = -1
+
+logger = logging.getLogger("Shared Frames")
+
+
+class FrameRing:
+    # A ring of shared memory slots, each big enough for one frame. The producer copies a
+    # captured frame into a free slot once and posts a small metadata record (slot, seq,
+    # timestamp) to every consumer's mailbox; consumers map the slot straight into a numpy
+    # array, so the pixels are never pickled or copied between processes.
+    #
+    # The ring is created in the capture process and handed to worker processes as a
+    # multiprocessing.Process argument; shared memory blocks reattach by name when unpickled.
+    def __init__ (self, context, shape, consumers, slots=4, dtype=np.uint8):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.nbytes = int(np.prod(self.shape))*self.dtype.itemsize
+        self.blocks = [shared_memory.SharedMemory(create=True, size=self.nbytes) for _ in range(slots)]
+        # Number of consumers still holding each slot, a slot can only be rewritten at zero
+        self.refcounts = context.Array('i', slots)
+        # One mailbox per consumer holding [slot, seq, timestamp], slot -1 when empty.
+        # A consumer only ever has the newest frame waiting, like FrameHub subscriptions.
+        self.mailboxes = [context.Array('d', [EMPTY, 0, 0]) for _ in range(consumers)]
+        self.conditions = [context.Condition(mailbox.get_lock()) for mailbox in self.mailboxes]
+        self.next = 0
+        self.published = 0
+        self.dropped = 0
+
+    def publish(self, frame):
+        if frame.image.shape != self.shape or frame.image.dtype != self.dtype:
+            raise ValueError('Frame %s %s does not fit ring slots %s %s' % (frame.image.shape,
+                frame.image.dtype, self.shape, self.dtype))
+
+        slot = self.acquire()
+        if slot is None:
+            # Every slot is still being read, the capture side is too far ahead
+            self.dropped += 1
+            return False
+
+        np.ndarray(self.shape, self.dtype, buffer=self.blocks[slot].buf)[...] = frame.image
+        for mailbox, condition in zip(self.mailboxes, self.conditions):
+            with condition:
+                # Latest frame wins: take back the stale frame the consumer has not picked up yet
+                if mailbox[0] != EMPTY:
+                    self.release(int(mailbox[0]))
+                mailbox[0] = slot
+                mailbox[1] = frame.seq
+                mailbox[2] = frame.timestamp
+                condition.notify()
+        self.published += 1
+        return True
+
+    def acquire(self):
+        slots = len(self.blocks)
+        with self.refcounts.get_lock():
+            for i in range(slots):
+                slot = (self.next + i) % slots
+                if self.refcounts[slot] == 0:
+                    self.refcounts[slot] = len(self.mailboxes)
+                    self.next = (slot + 1) % slots
+                    return slot
+        return None
+
+    def release(self, slot):
+        with self.refcounts.get_lock():
+            self.refcounts[slot] -= 1
+
+    def reader(self, index):
+        return FrameReader(self, index)
+
+    def close(self):
+        for block in self.blocks:
+            block.close()
+
+    def unlink(self):
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+
+
+class FrameReader:
+    # Consumer side of a FrameRing. A slot stays reserved for this reader until the next read(),
+    # so the returned image must not be used after that.
+    def __init__ (self, ring, index):
+        self.ring = ring
+        self.mailbox = ring.mailboxes[index]
+        self.condition = ring.conditions[index]
+        self.held = None
+        self.received = 0
+        self.lastSeq = None
+        self.missed = 0
+
+    def read(self, timeout=None):
+        self.release()
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.mailbox[0] != EMPTY, timeout):
+                return None
+            slot, seq, timestamp = int(self.mailbox[0]), int(self.mailbox[1]), self.mailbox[2]
+            self.mailbox[0] = EMPTY
+
+        if self.lastSeq is not None:
+            self.missed += seq - self.lastSeq - 1
+        self.lastSeq = seq
+        self.received += 1
+        self.held = slot
+        image = np.ndarray(self.ring.shape, self.ring.dtype, buffer=self.ring.blocks[slot].buf)
+        return Frame(seq, timestamp, image)
+
+    def release(self):
+        if self.held is not None:
+            self.ring.release(self.held)
+            self.held = None
+
+    def close(self):
+        self.release()
+        self.ring.close()
@@ -0,0 +1,89 @@
+import os
+import logging
+
+import cv2
+
+logger = logging.getLogger("Thread Budget")
+
+ch = logging.StreamHandler()
+ch.setLevel(logging.DEBUG)
+logger.addHandler(ch)
+
+
+class ThreadBudget:
+    # How many threads every thread pool in the process may use. TensorFlow and OpenCV
+    # both size their pools to the whole machine by default, so a few sessions plus
+    # OpenCV already oversubscribe every core several times over.
+    #   intra_op/inter_op: per tf.Session pools, 0 lets TensorFlow pick
+    #   opencv: cv2.setNumThreads, 0 runs OpenCV on the calling thread, -1 keeps its default
+    #   sessions: {model name: (intra_op, inter_op)} overrides for single models
+    #   cores: CPU ids the process is pinned to, None leaves the affinity alone
+    def __init__ (self, intra_op=0, inter_op=0, opencv=-1, sessions=None, cores=None):
+        self.intra_op = intra_op
+        self.inter_op = inter_op
+        self.opencv = opencv
+        self.sessions = sessions or {}
+        self.cores = cores
+
+    def sessionThreads(self, name=None):
+        return self.sessions.get(name, (self.intra_op, self.inter_op))
+
+    def __repr__ (self):
+        return 'ThreadBudget(intra_op=%d, inter_op=%d, opencv=%d, cores=%s)' % (self.intra_op,
+            self.inter_op, self.opencv, self.cores)
+
+
+# The budget every session created from now on in this process gets
+budget = ThreadBudget()
+
+
+def configure(newBudget):
+    # Call before any model is loaded: TensorFlow sizes a session's pools when it is created
+    global budget
+    budget = newBudget
+    if budget.cores is not None:
+        pinCores(budget.cores)
+    if budget.opencv >= 0:
+        cv2.setNumThreads(budget.opencv)
+    logger.info('Using %s' % (budget,))
+    return budget
+
+
+def sessionConfig(name=None, base=None):
+    # A tf.ConfigProto for the model `name` with the budget's thread counts,
+    # copied from base (e.g. a config with GPU options) if given
+    import tensorflow as tf
+
+    config = tf.ConfigProto()
+    if base is not None:
+        config.CopyFrom(base)
+    config.intra_op_parallelism_threads, config.inter_op_parallelism_threads = budget.sessionThreads(name)
+    return config
+
+
+def pinCores(cores):
+    # Threads created afterwards inherit the affinity, so pin before TensorFlow starts its pools
+    if not hasattr(os, 'sched_setaffinity'):
+        logger.warning('Core pinning is not supported on this platform')
+        return False
+    os.sched_setaffinity(0, cores)
+    return True
+
+
+def splitCores(groups, cores=None):
+    # Disjoint, roughly equal sets of CPU ids, one per pipeline
+    if cores is None:
+        cores = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count()))
+    if groups > len(cores):
+        # More pipelines than cores: they have to share
+        return [[cores[i % len(cores)]] for i in range(groups)]
+    size = len(cores)//groups
+    return [cores[i*size:(i + 1)*size] if i < groups - 1 else cores[i*size:] for i in range(groups)]
+
+
+def budgetFor(pipelines, cores=None):
+    # A starting point for `pipelines` concurrent detectors sharing the machine:
+    # each session gets its share of the cores and OpenCV stays on the caller's thread
+    cores = cores or os.cpu_count()
+    share = max(1, cores//max(1, pipelines))
+    return ThreadBudget(intra_op=share, inter_op=1 if share < 4 else 2, opencv=0 if pipelines > 1 else -1)
@@ -0,0 +1,78 @@
+import math
+import time
+import threading
+
+# Votes are counted per bucket of this many seconds, windows are rounded up to whole buckets
+BUCKET = 1.0
+# Windows, in seconds, kept counted at all times; the longest one bounds the memory
+WINDOWS = (10, 60, 300)
+# The window len() counts over, alarms fire on the votes of the last 5 minutes
+DEFAULT_WINDOW = 300
+
+
+class VoteCounter:
+    # Votes in the last W seconds for a few fixed windows. Votes land in a ring of
+    # per-second buckets sized for the longest window, and every window keeps a running
+    # total: adding a vote and asking for a count are O(1), however busy the scene.
+    def __init__ (self, windows=WINDOWS, bucket=BUCKET, default=DEFAULT_WINDOW, clock=time.time):
+        self.bucket = bucket
+        self.default = default
+        self.clock = clock
+        # {window in seconds: window in buckets}
+        self.windows = dict((window, int(math.ceil(window/float(bucket)))) for window in set(windows) | {default})
+        self.size = max(self.windows.values())
+        self.buckets = [0]*self.size
+        self.totals = dict((window, 0) for window in self.windows)
+        self.current = None
+        self.last = None
+        self.lock = threading.Lock()
+
+    def advance(self, now):
+        index = int(now//self.bucket)
+        if self.current is None or index - self.current >= self.size:
+            # Everything counted so far has left every window
+            self.buckets = [0]*self.size
+            self.totals = dict((window, 0) for window in self.windows)
+        elif index > self.current:
+            for step in range(self.current + 1, index + 1):
+                for window, length in self.windows.items():
+                    self.totals[window] -= self.buckets[(step - length) % self.size]
+                self.buckets[step % self.size] = 0
+        else:
+            # The clock went backwards, keep counting into the current bucket
+            index = self.current
+        self.current = index
+
+    def add(self, votes=1, now=None):
+        now = self.clock() if now is None else now
+        with self.lock:
+            self.advance(now)
+            self.buckets[self.current % self.size] += votes
+            for window in self.totals:
+                self.totals[window] += votes
+            self.last = now
+
+    def count(self, window=None, now=None):
+        window = self.default if window is None else window
+        if window not in self.windows:
+            raise ValueError('Votes are not counted over %s seconds, only over %s' % (window, sorted(self.windows)))
+        with self.lock:
+            self.advance(self.clock() if now is None else now)
+            return self.totals[window]
+
+    def counts(self, now=None):
+        # {window: votes} for every window
+        with self.lock:
+            self.advance(self.clock() if now is None else now)
+            return dict(self.totals)
+
+    def clear(self):
+        with self.lock:
+            self.current = None
+            self.last = None
+            self.buckets = [0]*self.size
+            self.totals = dict((window, 0) for window in self.windows)
+
+    def __len__ (self):
+        # Callers used to get a list of vote times and take its length
+        return self.count()